@@ -3,51 +3,65 @@ from __future__ import annotations
 import json
 import os
 import re
-import shutil
-import subprocess
 import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Optional
 
-try:
-    from pydantic import BaseModel, Field, ConfigDict
-except Exception:  # pragma: no cover - pydantic v1
-    from pydantic import BaseModel, Field
-    ConfigDict = None
-
 
 DEFAULT_TMP_DIR_NAME = ".tmp-test"
+CHECKOUT_MARKER_NAME = ".pf-checkout-commit"
+# Captures each non-blank line without its leading/trailing whitespace.
+_NONBLANK_LINE_RE = re.compile(r"^[^\S\n]*(\S.*?)[^\S\n]*$", re.M)
 
 
-class BugsInPyAdapterRequest(BaseModel):
-    if ConfigDict:
-        model_config = ConfigDict(extra="forbid")
-    else:  # pragma: no cover - pydantic v1
-        class Config:
-            extra = "forbid"
-
-    bugsinpy_root: str = Field(..., description="Path to BugsInPy root")
-    project_name: str = Field(..., description="BugsInPy project name")
-    bug_id: str = Field(..., description="Bug id")
-    variant: str = Field(..., description="buggy or fixed")
-
-
-class BugsInPyAdapterResponse(BaseModel):
-    if ConfigDict:
-        model_config = ConfigDict(extra="forbid")
-    else:  # pragma: no cover - pydantic v1
-        class Config:
-            extra = "forbid"
-
-    resolved_project_dir: str
-    install_cmds: list[str]
-    repo_setup_cmds: list[str]
-    test_cmds: list[str]
-    env: dict[str, str]
-    provenance: dict[str, Any]
-
-
-def _model_dump(model: BaseModel) -> dict[str, Any]:
+@lru_cache(maxsize=None)
+def _define_models() -> tuple[type, type]:
+    # pydantic is only needed at the CLI boundary; helper imports stay cheap.
+    try:
+        from pydantic import BaseModel, Field, ConfigDict
+    except Exception:  # pragma: no cover - pydantic v1
+        from pydantic import BaseModel, Field
+        ConfigDict = None
+
+    class BugsInPyAdapterRequest(BaseModel):
+        if ConfigDict:
+            model_config = ConfigDict(extra="forbid")
+        else:  # pragma: no cover - pydantic v1
+            class Config:
+                extra = "forbid"
+
+        bugsinpy_root: str = Field(..., description="Path to BugsInPy root")
+        project_name: str = Field(..., description="BugsInPy project name")
+        bug_id: str = Field(..., description="Bug id")
+        variant: str = Field(..., description="buggy or fixed")
+
+    class BugsInPyAdapterResponse(BaseModel):
+        if ConfigDict:
+            model_config = ConfigDict(extra="forbid")
+        else:  # pragma: no cover - pydantic v1
+            class Config:
+                extra = "forbid"
+
+        resolved_project_dir: str
+        install_cmds: list[str]
+        repo_setup_cmds: list[str]
+        test_cmds: list[str]
+        env: dict[str, str]
+        provenance: dict[str, Any]
+
+    return BugsInPyAdapterRequest, BugsInPyAdapterResponse
+
+
+def __getattr__(name: str) -> Any:
+    if name == "BugsInPyAdapterRequest":
+        return _define_models()[0]
+    if name == "BugsInPyAdapterResponse":
+        return _define_models()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _model_dump(model: Any) -> dict[str, Any]:
     if hasattr(model, "model_dump"):
         return model.model_dump()
     return model.dict()
@@ -61,32 +75,35 @@ def _tmp_root(root: Path) -> Path:
 
 
 def _read_lines(path: Path) -> list[str]:
-    if not path.exists():
+    try:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+    except FileNotFoundError:
         return []
-    raw = path.read_text(encoding="utf-8", errors="ignore").splitlines()
-    return [line.strip() for line in raw if line.strip()]
+    return _NONBLANK_LINE_RE.findall(text)
 
 
 def _parse_bug_info(path: Path) -> dict[str, str]:
+    try:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Missing bug.info at {path}") from None
     info: dict[str, str] = {}
-    if not path.exists():
-        raise FileNotFoundError(f"Missing bug.info at {path}")
-    for line in _read_lines(path):
-        if "=" not in line:
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if not sep:
             continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip().strip('"')
-        info[key] = value
+        info[key.strip()] = value.strip().strip('"')
     return info
 
 
 def _pythonpath_env(pythonpath_value: str, project_dir: Path) -> Optional[str]:
     if not pythonpath_value:
         return None
-    parts = [part for part in pythonpath_value.split(";") if part.strip()]
-    resolved = [str(project_dir / part) for part in parts]
-    return ":".join(resolved)
+    base = str(project_dir)
+    resolved = [
+        os.path.join(base, part) for part in pythonpath_value.split(";") if part.strip()
+    ]
+    return os.pathsep.join(resolved) or None
 
 
 def _install_cmds(work_dir: Path) -> list[str]:
@@ -130,7 +147,11 @@ def _bugsinpy_checkout(
     bug_id: str,
     variant: str,
     work_dir: Path,
+    expected_commit: Optional[str] = None,
 ) -> Path:
+    import shutil
+    import subprocess
+
     framework_bin = bugsinpy_root / "framework" / "bin" / "bugsinpy-checkout"
     if not framework_bin.exists():
         raise FileNotFoundError(f"Missing bugsinpy-checkout at {framework_bin}")
@@ -139,8 +160,25 @@ def _bugsinpy_checkout(
     work_dir.mkdir(parents=True, exist_ok=True)
 
     target_dir = work_dir / project_name
+    marker = work_dir / CHECKOUT_MARKER_NAME
+    if expected_commit and target_dir.is_dir():
+        # Reuse a checkout this adapter already produced at the expected commit,
+        # provided nothing in it changed since (edits, new or ignored files).
+        try:
+            recorded = marker.read_text(encoding="utf-8").split("\n", 1)
+        except OSError:
+            recorded = []
+        if (
+            len(recorded) == 2
+            and recorded[0] == expected_commit
+            and _git_head(target_dir) == expected_commit
+            and recorded[1] == _worktree_state(target_dir)
+        ):
+            return target_dir
+
     if target_dir.exists():
         shutil.rmtree(target_dir)
+    marker.unlink(missing_ok=True)
 
     cmd = [
         str(framework_bin),
@@ -157,19 +195,80 @@ def _bugsinpy_checkout(
 
     if not target_dir.exists():
         raise RuntimeError("Checkout did not create project directory")
+    if expected_commit and _git_head(target_dir) == expected_commit:
+        # bugsinpy-checkout leaves its own edits and bugsinpy_* files behind, so
+        # "clean" means "as checked out": record that state next to the commit.
+        state = _worktree_state(target_dir)
+        if state is not None:
+            marker.write_text(f"{expected_commit}\n{state}", encoding="utf-8")
     return target_dir
 
 
+def _worktree_state(path: Path) -> Optional[str]:
+    # Tree id of the working copy (tracked and untracked files) staged into a
+    # scratch copy of the index, plus the ignored paths git status reports.
+    import shutil
+    import subprocess
+    import tempfile
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = Path(tmp) / "index"
+            real_index = _git_dir(path) / "index"
+            if real_index.is_file():
+                # Seeding with the real index lets git skip rehashing unchanged files.
+                shutil.copyfile(real_index, index)
+            env = dict(os.environ, GIT_INDEX_FILE=str(index))
+            git = ["git", "-C", str(path)]
+            subprocess.run(git + ["add", "-A"], env=env, check=True, capture_output=True)
+            tree = subprocess.run(
+                git + ["write-tree"], env=env, check=True, capture_output=True, text=True
+            ).stdout.strip()
+            ignored = subprocess.run(
+                git + ["status", "--porcelain", "--ignored", "--untracked-files=all"],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    ignored_paths = sorted(line for line in ignored.splitlines() if line.startswith("!! "))
+    return "\n".join([tree, *ignored_paths])
+
+
+def _git_dir(path: Path) -> Path:
+    git_path = path / ".git"
+    if git_path.is_file():
+        # Worktrees and submodules point at the real git dir via "gitdir: <path>".
+        text = git_path.read_text(encoding="utf-8").strip()
+        if text.startswith("gitdir:"):
+            return (path / text[len("gitdir:"):].strip()).resolve()
+    return git_path
+
+
 def _git_head(path: Path) -> Optional[str]:
+    # Resolve HEAD from the git dir directly instead of spawning `git rev-parse`.
     try:
-        result = subprocess.run(
-            ["git", "-C", str(path), "rev-parse", "HEAD"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        return result.stdout.strip()
+        git_dir = _git_dir(path)
+        head = (git_dir / "HEAD").read_text(encoding="utf-8").strip()
+        if not head.startswith("ref:"):
+            return head or None
+        ref = head[len("ref:"):].strip()
+        commondir = git_dir / "commondir"
+        if commondir.is_file():
+            # Linked worktrees keep branch refs in the main repository's git dir.
+            git_dir = (git_dir / commondir.read_text(encoding="utf-8").strip()).resolve()
+        ref_path = git_dir / ref
+        if ref_path.is_file():
+            return ref_path.read_text(encoding="utf-8").strip() or None
+        packed_refs = git_dir / "packed-refs"
+        if packed_refs.is_file():
+            for line in packed_refs.read_text(encoding="utf-8").splitlines():
+                sha, _, name = line.partition(" ")
+                if name.strip() == ref:
+                    return sha
+        return None
     except Exception:
         return None
 
@@ -185,10 +284,11 @@ def adapt_bugsinpy(request: BugsInPyAdapterRequest) -> BugsInPyAdapterResponse:
     bug_info_path = bug_dir / "bug.info"
 
     info = _parse_bug_info(bug_info_path)
+    expected_commit = _expected_commit(info, variant)
 
     work_root = _tmp_root(bugsinpy_root) / "bugsinpy" / project_name / bug_id / variant
     resolved_project_dir = _bugsinpy_checkout(
-        bugsinpy_root, project_name, bug_id, variant, work_root
+        bugsinpy_root, project_name, bug_id, variant, work_root, expected_commit
     )
 
     install_cmds = _install_cmds(resolved_project_dir)
@@ -201,7 +301,6 @@ def adapt_bugsinpy(request: BugsInPyAdapterRequest) -> BugsInPyAdapterResponse:
     if pythonpath:
         env["PYTHONPATH"] = pythonpath
 
-    expected_commit = _expected_commit(info, variant)
     actual_head = _git_head(resolved_project_dir)
 
     provenance = {
@@ -218,7 +317,8 @@ def adapt_bugsinpy(request: BugsInPyAdapterRequest) -> BugsInPyAdapterResponse:
         "work_dir": str(work_root),
     }
 
-    return BugsInPyAdapterResponse(
+    _, response_model = _define_models()
+    return response_model(
         resolved_project_dir=str(resolved_project_dir),
         install_cmds=install_cmds,
         repo_setup_cmds=repo_setup_cmds,
@@ -230,6 +330,7 @@ def adapt_bugsinpy(request: BugsInPyAdapterRequest) -> BugsInPyAdapterResponse:
 
 if __name__ == "__main__":
     raw = json.loads(sys.stdin.read())
-    req = BugsInPyAdapterRequest(**raw)
+    request_model, _ = _define_models()
+    req = request_model(**raw)
     resp = adapt_bugsinpy(req)
     print(json.dumps(_model_dump(resp), indent=2))
@@ -1,7 +1,17 @@
 import json
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from itertools import chain
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
 
 HARD_SKIP_TOKENS = [
     "pywin32",
@@ -11,26 +21,58 @@ HARD_SKIP_TOKENS = [
     "torch",
 ]
 SOFT_SKIP_TOKENS = ["lxml"]
+SOFT_SKIP_TOKENS_B = [token.encode("utf-8") for token in SOFT_SKIP_TOKENS]
+
+# A requirements line that is neither blank nor a comment.
+_REQ_LINE_RE = re.compile(rb"^[^\S\n]*[^\s#]", re.M)
+
+
+@dataclass(slots=True)
+class _Candidate:
+    project: str
+    bug_id: str
+    runner: str
+    score: int
+    test_cmd: str
+    python_version: str | None
+    requirements_count: int
+    risk: str
 
 
-def _read_text(path: Path) -> str:
-    if not path.exists():
+def _read_text(path: str) -> str:
+    try:
+        with open(path, encoding="utf-8", errors="ignore") as handle:
+            return handle.read()
+    except OSError:
         return ""
-    return path.read_text(encoding="utf-8", errors="ignore")
 
 
-def _parse_bug_info(path: Path) -> dict[str, str]:
+def _read_bytes(path: str) -> bytes:
+    try:
+        with open(path, "rb") as handle:
+            return handle.read()
+    except OSError:
+        return b""
+
+
+def _parse_bug_info(path: str) -> dict[str, str]:
     info: dict[str, str] = {}
-    if not path.exists():
-        return info
     for line in _read_text(path).splitlines():
-        if "=" not in line:
+        key, sep, value = line.partition("=")
+        if not sep:
             continue
-        key, value = line.split("=", 1)
         info[key.strip()] = value.strip().strip('"')
     return info
 
 
+def _dumps(data: object) -> str:
+    if orjson is not None:
+        return orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        ).decode("utf-8")
+    return json.dumps(data, indent=2, sort_keys=True)
+
+
 def _parse_python_version(version: str | None) -> tuple[int, int] | None:
     if not version:
         return None
@@ -50,120 +92,154 @@ def _load_request() -> dict:
     return json.loads(payload)
 
 
-def _score_candidate(req_text: str, runner: str) -> int:
+def _score_candidate(
+    req_bytes: bytes,
+    req_count: int,
+    runner: str,
+    soft_skip_tokens: list[bytes] = SOFT_SKIP_TOKENS_B,
+) -> int:
+    # req_bytes is the lowercased requirements.txt content.
     score = 0
     if runner in {"unittest", "tox"}:
         score += 2
-    if "git+" not in req_text and "http" not in req_text:
+    if b"git+" not in req_bytes and b"http" not in req_bytes:
         score += 1
-    req_lines = [
-        line
-        for line in req_text.splitlines()
-        if line.strip() and not line.strip().startswith("#")
-    ]
-    if len(req_lines) <= 20:
+    if req_count <= 20:
         score += 1
-    if any(token in req_text for token in SOFT_SKIP_TOKENS):
+    if any(token in req_bytes for token in soft_skip_tokens):
         score -= 2
     return score
 
 
+def _scan_project(scan_args: tuple) -> list[_Candidate]:
+    (
+        project_path,
+        require_non_pytest,
+        hard_skip_tokens,
+        soft_skip_tokens,
+        min_python_parts,
+    ) = scan_args
+    project_name = os.path.basename(project_path)
+    candidates: list[_Candidate] = []
+    # One scandir per directory replaces the per-file exists()/is_dir() probes.
+    try:
+        bug_entries = list(os.scandir(os.path.join(project_path, "bugs")))
+    except OSError:
+        return []
+    for bug_entry in bug_entries:
+        if not bug_entry.is_dir():
+            continue
+        bug_path = bug_entry.path
+        try:
+            names = {entry.name for entry in os.scandir(bug_path)}
+        except OSError:
+            continue
+        if "run_test.sh" not in names:
+            continue
+        test_cmd = _read_text(os.path.join(bug_path, "run_test.sh")).strip()
+        if not test_cmd:
+            continue
+        if require_non_pytest and "pytest" in test_cmd:
+            continue
+
+        runner = "other"
+        if "unittest" in test_cmd:
+            runner = "unittest"
+        elif "tox" in test_cmd:
+            runner = "tox"
+        elif "nosetests" in test_cmd or "nose" in test_cmd:
+            runner = "nose"
+
+        has_setup = "setup.sh" in names
+        if has_setup:
+            setup_bytes = _read_bytes(os.path.join(bug_path, "setup.sh")).lower()
+            if b"pip install unittest" in setup_bytes:
+                continue
+
+        # Requirements are ASCII in practice; search the raw bytes without decoding.
+        req_bytes = (
+            _read_bytes(os.path.join(bug_path, "requirements.txt")).lower()
+            if "requirements.txt" in names
+            else b""
+        )
+        req_count = len(_REQ_LINE_RE.findall(req_bytes))
+        if not req_count and not has_setup:
+            continue
+
+        if any(token in req_bytes for token in hard_skip_tokens):
+            continue
+
+        info = (
+            _parse_bug_info(os.path.join(bug_path, "bug.info"))
+            if "bug.info" in names
+            else {}
+        )
+        py_ver = info.get("python_version")
+        py_parts = _parse_python_version(py_ver)
+        if py_parts and py_parts < min_python_parts:
+            continue
+
+        score = _score_candidate(req_bytes, req_count, runner, soft_skip_tokens)
+        candidates.append(
+            _Candidate(
+                project=project_name,
+                bug_id=bug_entry.name,
+                runner=runner,
+                score=score,
+                test_cmd=test_cmd,
+                python_version=py_ver,
+                requirements_count=req_count,
+                risk="lxml" if b"lxml" in req_bytes else "",
+            )
+        )
+
+    return candidates
+
+
 def main() -> None:
     request = _load_request()
     bugsinpy_root = Path(request.get("bugsinpy_root", "/mnt/Storage/Repos/BugsInPy"))
     require_non_pytest = bool(request.get("require_non_pytest", True))
     top_n = int(request.get("top_n", 5))
     min_python = request.get("min_python_version", "3.7")
-    hard_skip_tokens = request.get("hard_skip_tokens", HARD_SKIP_TOKENS)
-    soft_skip_tokens = request.get("soft_skip_tokens", SOFT_SKIP_TOKENS)
+    hard_skip_tokens = [
+        token.encode("utf-8")
+        for token in request.get("hard_skip_tokens", HARD_SKIP_TOKENS)
+    ]
+    soft_skip_tokens = [
+        token.encode("utf-8")
+        for token in request.get("soft_skip_tokens", SOFT_SKIP_TOKENS)
+    ]
 
     min_python_parts = _parse_python_version(min_python) or (3, 7)
 
     projects_root = bugsinpy_root / "projects"
-    candidates: list[dict[str, object]] = []
 
     if not projects_root.exists():
-        print(
-            json.dumps(
-                {"candidates": [], "note": "BugInPy projects root not found."},
-                indent=2,
-                sort_keys=True,
-            )
-        )
+        print(_dumps({"candidates": [], "note": "BugInPy projects root not found."}))
         return
 
-    for project_dir in projects_root.iterdir():
-        bugs_dir = project_dir / "bugs"
-        if not bugs_dir.is_dir():
-            continue
-        for bug_dir in bugs_dir.iterdir():
-            if not bug_dir.is_dir():
-                continue
-            run_test = bug_dir / "run_test.sh"
-            reqs = bug_dir / "requirements.txt"
-            bug_info = bug_dir / "bug.info"
-            setup_sh = bug_dir / "setup.sh"
-            if not run_test.exists():
-                continue
-            test_cmd = _read_text(run_test).strip()
-            if not test_cmd:
-                continue
-            if require_non_pytest and "pytest" in test_cmd:
-                continue
-
-            runner = "other"
-            if "unittest" in test_cmd:
-                runner = "unittest"
-            elif "tox" in test_cmd:
-                runner = "tox"
-            elif "nosetests" in test_cmd or "nose" in test_cmd:
-                runner = "nose"
-
-            if setup_sh.exists():
-                setup_text = _read_text(setup_sh).lower()
-                if "pip install unittest" in setup_text:
-                    continue
-
-            req_text = _read_text(reqs).lower() if reqs.exists() else ""
-            req_lines = [
-                line
-                for line in req_text.splitlines()
-                if line.strip() and not line.strip().startswith("#")
-            ]
-            has_requirements = bool(req_lines)
-            if not has_requirements and not setup_sh.exists():
-                continue
-
-            if any(token in req_text for token in hard_skip_tokens):
-                continue
-
-            if any(token in req_text for token in soft_skip_tokens):
-                pass
-
-            info = _parse_bug_info(bug_info)
-            py_ver = info.get("python_version")
-            py_parts = _parse_python_version(py_ver)
-            if py_parts and py_parts < min_python_parts:
-                continue
-
-            score = _score_candidate(req_text, runner)
-            candidates.append(
-                {
-                    "project": project_dir.name,
-                    "bug_id": bug_dir.name,
-                    "runner": runner,
-                    "score": score,
-                    "test_cmd": test_cmd,
-                    "python_version": py_ver,
-                    "requirements_count": len(req_lines),
-                    "risk": "lxml" if "lxml" in req_text else "",
-                }
-            )
+    project_paths = [
+        entry.path for entry in os.scandir(projects_root) if entry.is_dir()
+    ]
+    scan_args = [
+        (
+            project_path,
+            require_non_pytest,
+            hard_skip_tokens,
+            soft_skip_tokens,
+            min_python_parts,
+        )
+        for project_path in project_paths
+    ]
+    # Projects are independent, so scan them in parallel and merge once.
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_scan_project, scan_args, chunksize=4)
+        candidates = list(chain.from_iterable(results))
 
-    candidates.sort(
-        key=lambda x: (-int(x["score"]), str(x["project"]), str(x["bug_id"]))
-    )
-    top_candidates = candidates[:top_n]
+    candidates.sort(key=lambda c: (-c.score, c.project, c.bug_id))
+    # Only the survivors are converted to dicts for the JSON report.
+    top_candidates = [asdict(candidate) for candidate in candidates[:top_n]]
 
     note = None
     selected = None
@@ -179,7 +255,7 @@ def main() -> None:
         "require_non_pytest": require_non_pytest,
         "top_n": top_n,
     }
-    print(json.dumps(output, indent=2, sort_keys=True))
+    print(_dumps(output))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
+import os
+import subprocess
 import tempfile
 from pathlib import Path
 
 from bugsinpy_adapter import (
+    _bugsinpy_checkout,
+    _git_head,
     _install_cmds,
     _parse_bug_info,
     _pythonpath_env,
@@ -60,3 +64,96 @@ def test_pythonpath_env():
         env = _pythonpath_env(value, project_dir)
         assert str(project_dir / "src") in env
         assert str(project_dir / "lib") in env
+
+
+def test_git_head_reads_loose_and_packed_refs():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        _write(repo / ".git" / "HEAD", "ref: refs/heads/master\n")
+        _write(repo / ".git" / "packed-refs", "# pack-refs with: peeled\n" + "a" * 40 + " refs/heads/master\n")
+        assert _git_head(repo) == "a" * 40
+
+        _write(repo / ".git" / "refs" / "heads" / "master", "b" * 40 + "\n")
+        assert _git_head(repo) == "b" * 40
+
+        _write(repo / ".git" / "HEAD", "c" * 40 + "\n")
+        assert _git_head(repo) == "c" * 40
+
+
+def test_git_head_missing_repo():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert _git_head(Path(tmp)) is None
+
+
+def _git(repo: Path, *args: str) -> str:
+    result = subprocess.run(
+        ["git", "-C", str(repo), *args], check=True, capture_output=True, text=True
+    )
+    return result.stdout.strip()
+
+
+def _fake_bugsinpy(tmp: Path) -> tuple[Path, Path, str]:
+    # A bugsinpy-checkout stand-in that clones a template repo and, like the
+    # real script, leaves an edited tracked file and a bugsinpy_* file behind.
+    template = tmp / "template"
+    template.mkdir()
+    _git(template, "init", "-q")
+    _write(template / "app.py", "x = 1\n")
+    _write(template / ".gitignore", "*.pyc\n")
+    _git(template, "add", "-A")
+    _git(
+        template,
+        "-c",
+        "user.name=t",
+        "-c",
+        "user.email=t@example.com",
+        "commit",
+        "-qm",
+        "init",
+    )
+    root = tmp / "BugsInPy"
+    calls = tmp / "calls.log"
+    checkout = root / "framework" / "bin" / "bugsinpy-checkout"
+    _write(
+        checkout,
+        "#!/bin/sh\n"
+        f"echo run >> {calls}\n"
+        f'git clone -q {template} "$8/demo"\n'
+        'echo "x = 2" > "$8/demo/app.py"\n'
+        'echo "pytest" > "$8/demo/bugsinpy_run_test.sh"\n',
+    )
+    os.chmod(checkout, 0o755)
+    return root, calls, _git(template, "rev-parse", "HEAD")
+
+
+def test_checkout_reused_when_head_matches():
+    with tempfile.TemporaryDirectory() as tmp:
+        root, calls, commit = _fake_bugsinpy(Path(tmp))
+        work_dir = Path(tmp) / "work"
+
+        first = _bugsinpy_checkout(root, "demo", "1", "buggy", work_dir, commit)
+        second = _bugsinpy_checkout(root, "demo", "1", "buggy", work_dir, commit)
+        assert first == second == work_dir / "demo"
+        assert calls.read_text().count("run") == 1
+
+        _bugsinpy_checkout(root, "demo", "1", "buggy", work_dir, "b" * 40)
+        assert calls.read_text().count("run") == 2
+
+
+def test_dirty_checkout_is_not_reused():
+    with tempfile.TemporaryDirectory() as tmp:
+        root, calls, commit = _fake_bugsinpy(Path(tmp))
+        work_dir = Path(tmp) / "work"
+        target = _bugsinpy_checkout(root, "demo", "1", "buggy", work_dir, commit)
+
+        for dirty in (
+            lambda: _write(target / "app.py", "x = 3\n"),
+            lambda: _write(target / "scratch.py", "leftover\n"),
+            lambda: _write(target / "app.pyc", "cache"),
+        ):
+            dirty()
+            _bugsinpy_checkout(root, "demo", "1", "buggy", work_dir, commit)
+            assert (target / "app.py").read_text() == "x = 2\n"
+            assert not (target / "scratch.py").exists()
+            assert not (target / "app.pyc").exists()
+        assert calls.read_text().count("run") == 4
@@ -0,0 +1,70 @@
+import importlib.util
+import tempfile
+from pathlib import Path
+
+_SPEC = importlib.util.spec_from_file_location(
+    "ui_smoke_triage", Path(__file__).with_name("ui-smoke-triage.py")
+)
+triage = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(triage)
+
+
+def _write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def test_scan_reports_nested_and_overlapping_tokens():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        _write(
+            repo / "src" / "profile.ts",
+            "// header\nconst UserProfile = 1;\nconst ProfileCard = 2;\n",
+        )
+
+        hints = triage.search_repo_for_tokens(
+            ["Profile", "UserProfile", "ProfileCard", "rProf", "Missing"], repo
+        )
+
+        path = str(repo / "src" / "profile.ts")
+        assert hints == [
+            {"path": path, "line": 2},
+            {"path": path, "line": 2},
+            {"path": path, "line": 3},
+            {"path": path, "line": 2},
+        ]
+
+
+def test_rg_search_credits_every_token_on_a_line(monkeypatch):
+    import subprocess
+
+    # path:line pairs as rg -n -m 1 --null would print them; the path has a ':'.
+    files = {
+        "/repo/a:b.ts": ["import x", "const UserProfile = 1;", "const ProfileCard = 2;"],
+        "/repo/c.ts": ["Other()"],
+    }
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        patterns = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-e"]
+        calls.append(patterns)
+        assert "-m" in cmd and "--null" in cmd
+        assert "-o" not in cmd and "--sort" not in cmd
+        out = []
+        for path, lines in files.items():
+            for number, text in enumerate(lines, 1):
+                if any(p in text for p in patterns):
+                    out.append(f"{path}\x00{number}:{text}\n")
+                    break
+        return subprocess.CompletedProcess(cmd, 0 if out else 1, "".join(out), "")
+
+    monkeypatch.setattr(subprocess, "run", fake_run)
+    tokens = ["Profile", "UserProfile", "ProfileCard", "Missing"]
+    hits = triage._rg_search_tokens(tokens, Path("/repo"))
+
+    assert hits["Profile"] == {"path": "/repo/a:b.ts", "line": 2}
+    assert hits["UserProfile"] == {"path": "/repo/a:b.ts", "line": 2}
+    # Only on a later line of a file that already matched: found by a second pass.
+    assert hits["ProfileCard"] == {"path": "/repo/a:b.ts", "line": 3}
+    assert "Missing" not in hits
+    assert calls == [tokens, ["ProfileCard", "Missing"], ["Missing"]]
@@ -3,9 +3,19 @@ import argparse
 import json
 import os
 import re
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import uses_params
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional speedup
+    ijson = None
 
 STOP_WORDS = {
     'error', 'errors', 'failed', 'failure', 'cannot', 'could', 'would', 'should',
@@ -15,6 +25,15 @@ STOP_WORDS = {
     'script', 'module', 'webpack', 'dev', 'warn', 'warning', 'invalid',
 }
 
+_TOKEN_RE = re.compile(r'[A-Za-z][A-Za-z0-9_]{3,}')
+_PASCAL_RE = re.compile(r'[A-Z][A-Za-z0-9]+')
+_SCHEME_RE = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*$')
+_FILE_RE = re.compile(r'([A-Za-z0-9_@+./-]+\.(?:ts|tsx|js|jsx))(?::(\d+))?(?::(\d+))?')
+
+SKIP_DIR_NAMES = {'node_modules', '.next', 'artifacts', '.git'}
+
+_SOURCE_FILES_CACHE: dict[tuple[str, int, bool], list[str]] = {}
+
 CLASSIFICATION_ORDER = [
     'hydration-mismatch',
     'chunk-load-error',
@@ -27,41 +46,79 @@ CLASSIFICATION_ORDER = [
     'unknown',
 ]
 
+_CLASSIFICATION_RANK = {label: rank for rank, label in enumerate(CLASSIFICATION_ORDER)}
+
+# Text markers checked before any network status; the best-ranked hit wins.
+TEXT_MARKERS = {
+    'hydration': 'hydration-mismatch',
+    'chunkloaderror': 'chunk-load-error',
+    'loading chunk': 'chunk-load-error',
+    'chunk load': 'chunk-load-error',
+    'cors': 'cors-error',
+    'access-control-allow-origin': 'cors-error',
+}
+_TEXT_MARKER_RE = re.compile('|'.join(re.escape(marker) for marker in TEXT_MARKERS))
+
 
 def load_json(path: Path):
-    if not path.exists():
+    try:
+        raw = path.read_bytes()
+    except OSError:
+        return []
+    try:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        return []
+
+
+def load_console_errors(path: Path):
+    if ijson is None:
+        return [entry for entry in load_json(path) if entry.get('type') == 'error']
+    # Stream the array so non-error console entries are dropped as they are parsed.
+    try:
+        with path.open('rb') as handle:
+            return [
+                entry for entry in ijson.items(handle, 'item', use_float=True)
+                if isinstance(entry, dict) and entry.get('type') == 'error'
+            ]
+    except (OSError, ijson.JSONError):
         return []
-    with path.open('r', encoding='utf-8') as handle:
-        try:
-            return json.load(handle)
-        except json.JSONDecodeError:
-            return []
 
 
-def normalize_text(text: str) -> str:
-    return text.lower() if text else ''
+def dump_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
 
 
-def iter_error_texts(console_errors, page_errors):
+def iter_lowered_texts(console_errors, page_errors):
     for entry in page_errors:
-        if entry.get('message'):
-            yield entry['message']
-        if entry.get('stack'):
-            yield entry['stack']
+        for key in ('message', 'stack'):
+            value = entry.get(key)
+            if value:
+                yield value.lower()
     for entry in console_errors:
-        if entry.get('text'):
-            yield entry['text']
+        value = entry.get('text')
+        if value:
+            yield value.lower()
 
 
-def classify(console_errors, page_errors, network_failures):
-    texts = ' '.join(normalize_text(t) for t in iter_error_texts(console_errors, page_errors))
+def classify_texts(lowered_texts) -> str | None:
+    best = None
+    for text in lowered_texts:
+        for match in _TEXT_MARKER_RE.finditer(text):
+            label = TEXT_MARKERS[match.group(0)]
+            if best is None or _CLASSIFICATION_RANK[label] < _CLASSIFICATION_RANK[best]:
+                best = label
+                if best == CLASSIFICATION_ORDER[0]:
+                    return best
+    return best
 
-    if 'hydration' in texts:
-        return 'hydration-mismatch'
-    if 'chunkloaderror' in texts or 'loading chunk' in texts or 'chunk load' in texts:
-        return 'chunk-load-error'
-    if 'cors' in texts or 'access-control-allow-origin' in texts:
-        return 'cors-error'
+
+def classify(console_errors, page_errors, network_failures):
+    text_label = classify_texts(iter_lowered_texts(console_errors, page_errors))
+    if text_label:
+        return text_label
 
     if any(n.get('status') in (401, 403) for n in network_failures):
         return 'auth-error'
@@ -75,20 +132,50 @@ def classify(console_errors, page_errors, network_failures):
     if any((n.get('status') or 0) >= 500 for n in network_failures):
         return 'server-500'
 
-    if 'typeerror' in texts or 'referenceerror' in texts or 'cannot read properties' in texts:
-        return 'render-crash'
-
+    # Error texts only come from page/console errors, so any remaining text
+    # (TypeError, ReferenceError, ...) is a render crash.
     if page_errors or console_errors:
         return 'render-crash'
 
     return 'unknown'
 
 
-def is_api_request(url: str) -> bool:
-    path = urlparse(url).path
+def url_path(url: str) -> str:
+    # Same result as urlparse(url).path for the URLs ui-smoke records, without
+    # building a ParseResult for every network entry. Like urlparse, ;params
+    # are cut from the last segment for schemes in uses_params.
+    end = len(url)
+    for marker in ('?', '#'):
+        index = url.find(marker, 0, end)
+        if index >= 0:
+            end = index
+    start = 0
+    scheme = ''
+    colon = url.find(':', 0, end)
+    if colon > 0 and _SCHEME_RE.match(url, 0, colon):
+        start = colon + 1
+        scheme = url[:colon].lower()
+    if url.startswith('//', start):
+        slash = url.find('/', start + 2, end)
+        if slash < 0:
+            return ''
+        start = slash
+    path = url[start:end]
+    if ';' in path and scheme in uses_params:
+        params = path.find(';', max(path.rfind('/'), 0))
+        if params >= 0:
+            path = path[:params]
+    return path
+
+
+def is_api_path(path: str) -> bool:
     return path.startswith('/api/') or path == '/api'
 
 
+def is_api_request(url: str) -> bool:
+    return is_api_path(url_path(url))
+
+
 def is_app_route(path: str) -> bool:
     return path and not path.startswith('/_next') and not path.startswith('/favicon') and not path.startswith('/sw')
 
@@ -97,31 +184,27 @@ def is_route_404(network_entry) -> bool:
     status = network_entry.get('status')
     if status != 404:
         return False
-    path = urlparse(network_entry.get('url', '')).path
-    return is_app_route(path) and not is_api_request(network_entry.get('url', ''))
+    path = url_path(network_entry.get('url', ''))
+    return is_app_route(path) and not is_api_path(path)
 
 
 def extract_tokens(text: str) -> list[str]:
-    tokens = re.findall(r'[A-Za-z][A-Za-z0-9_]{3,}', text or '')
-    cleaned = []
-    for token in tokens:
-        lower = token.lower()
-        if lower in STOP_WORDS:
-            continue
-        cleaned.append(token)
-    # Prefer PascalCase tokens (likely component names)
-    pascal = [t for t in cleaned if re.match(r'[A-Z][A-Za-z0-9]+', t)]
-    ordered = pascal + [t for t in cleaned if t not in pascal]
+    # Prefer PascalCase tokens (likely component names), then the rest in order.
+    pascal = []
+    rest = []
     seen = set()
-    result = []
-    for token in ordered:
-        if token in seen:
+    for match in _TOKEN_RE.finditer(text or ''):
+        token = match.group(0)
+        if token in seen or token.lower() in STOP_WORDS:
             continue
         seen.add(token)
-        result.append(token)
-        if len(result) >= 5:
-            break
-    return result
+        if _PASCAL_RE.match(token):
+            pascal.append(token)
+            if len(pascal) >= 5:
+                break
+        else:
+            rest.append(token)
+    return (pascal + rest)[:5]
 
 
 def normalize_stack_path(raw_path: str) -> str:
@@ -138,8 +221,7 @@ def extract_stack_hints(stack: str, repo_root: Path) -> list[dict]:
     if not stack:
         return hints
     stack = stack.replace('file://', '')
-    file_re = re.compile(r'([A-Za-z0-9_@+./-]+\.(?:ts|tsx|js|jsx))(?::(\d+))?(?::(\d+))?')
-    for match in file_re.finditer(stack):
+    for match in _FILE_RE.finditer(stack):
         raw_path = match.group(1)
         line = match.group(2)
         if os.path.isabs(raw_path):
@@ -155,50 +237,33 @@ def extract_stack_hints(stack: str, repo_root: Path) -> list[dict]:
     return hints
 
 
-def search_repo_for_tokens(tokens: list[str], repo_root: Path) -> list[dict]:
-    hints = []
-    for token in tokens:
+def _walk_source_files(root: str) -> list[str]:
+    files = []
+    pending = [root]
+    while pending:
+        current = pending.pop()
         try:
-            result = subprocess.run(
-                [
-                    'rg', '-n', '-F', '-m', '1', token, str(repo_root),
-                    '--glob', '!node_modules/*', '--glob', '!.next/*', '--glob', '!artifacts/*'
-                ],
-                check=False,
-                capture_output=True,
-                text=True,
-            )
-        except FileNotFoundError:
-            break
-        if result.returncode not in (0, 1):
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
             continue
-        if not result.stdout.strip():
-            continue
-        line = result.stdout.strip().splitlines()[0]
-        parts = line.split(':', 2)
-        if len(parts) >= 2:
-            path = parts[0]
-            try:
-                line_no = int(parts[1])
-            except ValueError:
-                line_no = None
-            hint = {'path': path}
-            if line_no:
-                hint['line'] = line_no
-            hints.append(hint)
-    return hints
+        for entry in entries:
+            # Mirror rg defaults: skip hidden entries as well as build/vendor output.
+            if entry.name.startswith('.') or entry.name in SKIP_DIR_NAMES:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                files.append(entry.path)
+    return files
 
 
-def hint_for_route(url: str, repo_root: Path) -> list[dict]:
-    path = urlparse(url).path.strip('/')
-    if not path:
-        candidates = [repo_root / 'app' / 'page.tsx', repo_root / 'app' / 'page.jsx', repo_root / 'app' / 'page.ts']
-        return [{'path': str(c)} for c in candidates if c.exists()]
+def _rg_list_files(root: str) -> list[str]:
+    import subprocess
 
-    segment = path.split('/')[0]
     try:
         result = subprocess.run(
-            ['rg', '--files', '-g', f'app/**/{segment}/page.*', str(repo_root)],
+            ['rg', '--files', '--glob', '!node_modules/*', '--glob', '!.next/*', '--glob', '!artifacts/*', root],
             check=False,
             capture_output=True,
             text=True,
@@ -207,22 +272,149 @@ def hint_for_route(url: str, repo_root: Path) -> list[dict]:
         return []
     if result.returncode != 0:
         return []
-    hints = []
-    for line in result.stdout.strip().splitlines():
-        if line:
-            hints.append({'path': line})
-    return hints
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def list_source_files(repo_root: Path, use_rg: bool = False) -> list[str]:
+    # Listed once per (repo_root, root mtime, backend); every later token or
+    # route lookup in the process filters this list in memory.
+    root = str(repo_root)
+    try:
+        cache_key = (root, os.stat(root).st_mtime_ns, use_rg)
+    except OSError:
+        return []
+    cached = _SOURCE_FILES_CACHE.get(cache_key)
+    if cached is None:
+        cached = sorted(_rg_list_files(root) if use_rg else _walk_source_files(root))
+        _SOURCE_FILES_CACHE[cache_key] = cached
+    return cached
+
+
+def _scan_file_for_tokens(path: str, tokens: list[str]) -> dict[str, int]:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as handle:
+            text = handle.read()
+    except OSError:
+        return {}
+    if '\x00' in text:
+        return {}
+    # One find per token: tokens nested in or overlapping another token each
+    # keep their own first line, as a separate `rg -m 1` per token would.
+    found = {}
+    for token in tokens:
+        index = text.find(token)
+        if index >= 0:
+            found[token] = text.count('\n', 0, index) + 1
+    return found
 
 
-def build_error_entries(console_errors, page_errors, network_failures, repo_root: Path):
+def _scan_repo_for_tokens(tokens: list[str], repo_root: Path) -> dict[str, dict]:
+    first_hits: dict[str, dict] = {}
+    executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4))
+    try:
+        files = list_source_files(repo_root)
+        for path, found in zip(files, executor.map(lambda p: _scan_file_for_tokens(p, tokens), files)):
+            for token, line_no in found.items():
+                if token not in first_hits:
+                    first_hits[token] = {'path': path, 'line': line_no}
+            if len(first_hits) == len(tokens):
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return first_hits
+
+
+def _rg_search_tokens(tokens: list[str], repo_root: Path) -> dict[str, dict]:
+    import subprocess
+
+    # `-m 1` with several patterns stops at a file's first line matching any
+    # of them, so every printed line is credited to each token it contains and
+    # tokens still missing get another pass. A pass that finds none of them
+    # ends the search; usually one or two passes cover every token.
+    first_hits: dict[str, dict] = {}
+    remaining = list(tokens)
+    while remaining:
+        cmd = [
+            'rg', '-n', '-F', '-m', '1', '--null',
+            '--glob', '!node_modules/*', '--glob', '!.next/*', '--glob', '!artifacts/*',
+        ]
+        for token in remaining:
+            cmd.extend(['-e', token])
+        cmd.append(str(repo_root))
+        try:
+            result = subprocess.run(cmd, check=False, capture_output=True, text=True)
+        except FileNotFoundError:
+            break
+        if result.returncode != 0:
+            break
+        for line in result.stdout.splitlines():
+            # --null ends the path with NUL, so paths containing ':' parse too.
+            path, sep, rest = line.partition('\x00')
+            raw_line, _, text = rest.partition(':')
+            if not sep:
+                continue
+            hint = {'path': path}
+            try:
+                hint['line'] = int(raw_line)
+            except ValueError:
+                pass
+            for token in remaining:
+                if token not in first_hits and token in text:
+                    first_hits[token] = dict(hint)
+        still_missing = [token for token in remaining if token not in first_hits]
+        if len(still_missing) == len(remaining):
+            break
+        remaining = still_missing
+    return first_hits
+
+
+def search_repo_for_tokens_batch(token_groups: list[list[str]], repo_root: Path, use_rg: bool = False) -> list[list[dict]]:
+    unique_tokens = list(dict.fromkeys(token for tokens in token_groups for token in tokens))
+    first_hits: dict[str, dict] = {}
+    if unique_tokens:
+        if use_rg:
+            first_hits = _rg_search_tokens(unique_tokens, repo_root)
+        else:
+            first_hits = _scan_repo_for_tokens(unique_tokens, repo_root)
+    return [[first_hits[token] for token in tokens if token in first_hits] for tokens in token_groups]
+
+
+def search_repo_for_tokens(tokens: list[str], repo_root: Path, use_rg: bool = False) -> list[dict]:
+    return search_repo_for_tokens_batch([tokens], repo_root, use_rg=use_rg)[0]
+
+
+def _route_files(segment: str, repo_root: Path, use_rg: bool = False) -> list[str]:
+    app_prefix = os.path.join(str(repo_root), 'app') + os.sep
+    matches = []
+    for path in list_source_files(repo_root, use_rg=use_rg):
+        if not path.startswith(app_prefix):
+            continue
+        parent, name = os.path.split(path)
+        if name.startswith('page.') and os.path.basename(parent) == segment:
+            matches.append(path)
+    return matches
+
+
+def hint_for_route(url: str, repo_root: Path, use_rg: bool = False) -> list[dict]:
+    path = url_path(url).strip('/')
+    if not path:
+        candidates = [repo_root / 'app' / 'page.tsx', repo_root / 'app' / 'page.jsx', repo_root / 'app' / 'page.ts']
+        return [{'path': str(c)} for c in candidates if c.exists()]
+
+    segment = path.split('/')[0]
+    return [{'path': p} for p in _route_files(segment, repo_root, use_rg=use_rg)]
+
+
+def build_error_entries(console_errors, page_errors, network_failures, repo_root: Path, use_rg: bool = False):
     entries = []
+    pending_tokens = []
 
     for entry in page_errors:
         message = entry.get('message', '')
         stack = entry.get('stack')
         hints = extract_stack_hints(stack, repo_root)
         if not hints:
-            hints = search_repo_for_tokens(extract_tokens(message), repo_root)
+            pending_tokens.append((len(entries), extract_tokens(message)))
         entries.append({
             'type': 'pageerror',
             'message': message,
@@ -232,19 +424,27 @@ def build_error_entries(console_errors, page_errors, network_failures, repo_root
 
     for entry in console_errors:
         message = entry.get('text', '')
-        hints = search_repo_for_tokens(extract_tokens(message), repo_root)
+        pending_tokens.append((len(entries), extract_tokens(message)))
         entries.append({
             'type': 'console',
             'message': message,
             'stack': None,
-            'source_hints': hints,
+            'source_hints': [],
         })
 
+    # One search for every token of every error instead of one rg per token.
+    if pending_tokens:
+        token_hints = search_repo_for_tokens_batch(
+            [tokens for _, tokens in pending_tokens], repo_root, use_rg=use_rg
+        )
+        for (index, _), hints in zip(pending_tokens, token_hints):
+            entries[index]['source_hints'] = hints
+
     for entry in network_failures:
         url = entry.get('url', '')
         status = entry.get('status', '')
         message = f"{entry.get('method', 'GET')} {url} -> {status} {entry.get('statusText', '')}".strip()
-        hints = hint_for_route(url, repo_root)
+        hints = hint_for_route(url, repo_root, use_rg=use_rg)
         entries.append({
             'type': 'network',
             'message': message,
@@ -369,21 +569,21 @@ def main():
     parser = argparse.ArgumentParser(description='Triage ui-smoke artifacts and emit structured output.')
     parser.add_argument('artifacts', help='Path to artifacts/ui-smoke/<timestamp>')
     parser.add_argument('repo_root', help='Path to repo root for search hints')
+    parser.add_argument('--use-rg', action='store_true', help='Search the repo with ripgrep instead of the in-process scanner')
     args = parser.parse_args()
 
     artifact_dir = Path(args.artifacts).resolve()
     repo_root = Path(args.repo_root).resolve()
 
-    console_errors = [
-        entry for entry in load_json(artifact_dir / 'console.json')
-        if entry.get('type') == 'error'
-    ]
+    console_errors = load_console_errors(artifact_dir / 'console.json')
     page_errors = load_json(artifact_dir / 'pageerrors.json')
     network_failures = load_json(artifact_dir / 'network.json')
 
     classification = classify(console_errors, page_errors, network_failures)
 
-    error_entries = build_error_entries(console_errors, page_errors, network_failures, repo_root)
+    error_entries = build_error_entries(
+        console_errors, page_errors, network_failures, repo_root, use_rg=args.use_rg
+    )
     top_errors = error_entries[:3]
 
     failed_requests = summarize_failed_requests(network_failures)
@@ -398,7 +598,7 @@ def main():
         'minimal_fix_plan': minimal_fix_plan,
     }
 
-    (artifact_dir / 'triage.json').write_text(json.dumps(triage, indent=2), encoding='utf-8')
+    (artifact_dir / 'triage.json').write_bytes(dump_json(triage))
     write_markdown(artifact_dir, triage)
 
 
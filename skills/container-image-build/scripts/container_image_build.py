@@ -1,73 +1,165 @@
 from __future__ import annotations
 
+import contextlib
+import functools
 import hashlib
+import io
 import json
 import os
 import re
+import shutil
+import stat
+import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from pathlib import Path
 from typing import Any, Optional
 
 try:
-    from pydantic import BaseModel, Field, ConfigDict
-except Exception:  # pragma: no cover - pydantic v1
-    from pydantic import BaseModel, Field
-    ConfigDict = None
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
 
 try:
     import docker
     from docker.errors import DockerException, ImageNotFound, BuildError, APIError
+    from docker.utils.build import exclude_paths
 except Exception:  # pragma: no cover - docker not installed
     docker = None
     DockerException = ImageNotFound = BuildError = APIError = Exception
+    exclude_paths = None
 
 
 BASE_SYSTEM_PACKAGES = ["git", "build-essential", "curl"]
 BUILDER_SYSTEM_PACKAGES = ["python3-dev", "libffi-dev"]
 DEFAULT_PYTHON_VERSION = "3.11"
 DEFAULT_TMP_DIR_NAME = ".tmp-test"
+IMAGE_BUILD_DIR_REL = ".pf_manifest/image_build"
+# Dockerfile variant name -> (builder_tier, use_archive_apt, allow_unauth).
+_DOCKERFILE_VARIANTS = {
+    "Dockerfile": (False, False, False),
+    "Dockerfile.builder": (True, False, False),
+    "Dockerfile.archive": (False, True, False),
+    "Dockerfile.archive-unauth": (False, True, True),
+    "Dockerfile.builder-archive": (True, True, False),
+    "Dockerfile.builder-archive-unauth": (True, True, True),
+}
+
+
+# Plain dataclasses rather than pydantic: four fields each, and the pydantic
+# import dominated CLI start-up for short (cached) builds.
+@dataclass(slots=True, frozen=True)
+class ImageBuildRequest:
+    repo_dir: str  # checked-out repository directory
+    profile_path: str  # path to repo_profile.json
+    image_cache_dir: Optional[str] = None  # optional cache dir for image tar
+    force_rebuild: bool = False  # force rebuild even if image exists
+
+    @classmethod
+    def from_dict(cls, raw: Any) -> ImageBuildRequest:
+        if not isinstance(raw, dict):
+            raise ValueError("Request must be a JSON object.")
+        known = {field.name for field in fields(cls)}
+        unknown = sorted(set(raw) - known)
+        if unknown:
+            raise ValueError(f"Unexpected request fields: {', '.join(unknown)}")
+        missing = [name for name in ("repo_dir", "profile_path") if name not in raw]
+        if missing:
+            raise ValueError(f"Missing request fields: {', '.join(missing)}")
+        image_cache_dir = raw.get("image_cache_dir")
+        if image_cache_dir is not None:
+            image_cache_dir = _require_str(image_cache_dir, "image_cache_dir")
+        return cls(
+            repo_dir=_require_str(raw["repo_dir"], "repo_dir"),
+            profile_path=_require_str(raw["profile_path"], "profile_path"),
+            image_cache_dir=image_cache_dir,
+            force_rebuild=_coerce_bool(raw.get("force_rebuild", False), "force_rebuild"),
+        )
 
 
-class ImageBuildRequest(BaseModel):
-    if ConfigDict:
-        model_config = ConfigDict(extra="forbid")
-    else:  # pragma: no cover - pydantic v1
-        class Config:
-            extra = "forbid"
-
-    repo_dir: str = Field(..., description="Checked-out repository directory")
-    profile_path: str = Field(..., description="Path to repo_profile.json")
-    image_cache_dir: Optional[str] = Field(None, description="Optional cache dir for image tar")
-    force_rebuild: bool = Field(False, description="Force rebuild even if image exists")
-
-
-class ImageBuildResponse(BaseModel):
-    if ConfigDict:
-        model_config = ConfigDict(extra="forbid")
-    else:  # pragma: no cover - pydantic v1
-        class Config:
-            extra = "forbid"
-
+@dataclass(slots=True, frozen=True)
+class ImageBuildResponse:
     image_tag: str
     profile_id: str
     reused_cache: bool
     build_log_path: str
 
 
-def _model_dump(model: BaseModel) -> dict[str, Any]:
-    if hasattr(model, "model_dump"):
-        return model.model_dump()
-    return model.dict()
+_TRUE_STRINGS = frozenset({"1", "on", "t", "true", "y", "yes"})
+_FALSE_STRINGS = frozenset({"0", "off", "f", "false", "n", "no"})
+
+
+def _require_str(value: Any, name: str) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be a string.")
+    return value
+
+
+def _coerce_bool(value: Any, name: str) -> bool:
+    # Accepts the same loose spellings pydantic did for this field.
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in _TRUE_STRINGS:
+            return True
+        if lowered in _FALSE_STRINGS:
+            return False
+    raise ValueError(f"{name} must be a boolean.")
+
+
+def _model_dump(model: Any) -> dict[str, Any]:
+    # The models hold only scalars, so a shallow field copy replaces the
+    # recursive deepcopy dataclasses' dict conversion does.
+    return {field.name: getattr(model, field.name) for field in fields(model)}
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # json accepts NaN/Infinity and reports errors as before
+    return json.loads(data.decode("utf-8"))
+
+
+def _dumps(payload: Any, sort_keys: bool = True) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(payload, option=option)
+        except TypeError:
+            pass  # e.g. non-str keys or ints beyond 64 bits; json copes
+    return json.dumps(payload, indent=2, sort_keys=sort_keys).encode("utf-8")
 
 
 def _read_json(path: Path) -> dict[str, Any]:
-    return json.loads(path.read_text(encoding="utf-8"))
+    return _loads(path.read_bytes())
 
 
-def _stable_json(payload: dict[str, Any]) -> str:
-    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+# Reused across calls: json.dumps() builds a fresh encoder whenever non-default
+# options are passed. Kept on the stdlib encoder (not orjson) because profile
+# ids must match repo-profile-detect byte for byte (ensure_ascii, float repr).
+_STABLE_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def _stable_json_bytes(payload: dict[str, Any]) -> bytes:
+    # ensure_ascii output is pure ASCII, so this encode is a straight copy.
+    return _STABLE_ENCODER.encode(payload).encode("ascii")
 
 
 def _normalize_profile(profile: dict[str, Any]) -> dict[str, Any]:
@@ -78,8 +170,32 @@ def _normalize_profile(profile: dict[str, Any]) -> dict[str, Any]:
 
 def _profile_id(profile: dict[str, Any]) -> str:
     normalized = _normalize_profile(profile)
-    digest = hashlib.sha256(_stable_json(normalized).encode("utf-8")).hexdigest()
-    return digest
+    # Must match repo-profile-detect's _profile_id byte for byte: both the
+    # stored profile_id and this fallback name the same image tag and cache
+    # tar, so the digest algorithm is not ours to change. iterencode() would
+    # avoid the intermediate str but falls back to the pure-Python encoder.
+    return hashlib.sha256(_stable_json_bytes(normalized)).hexdigest()
+
+
+# Profile ids computed this process, keyed by the profile file's identity so
+# loops over unchanged profiles hash each one once.
+_PROFILE_ID_CACHE: dict[tuple[str, int, int], str] = {}
+
+
+def _cached_profile_id(
+    profile_path: Path, profile_stat: os.stat_result, profile: dict[str, Any]
+) -> str:
+    key = (os.path.abspath(profile_path), profile_stat.st_mtime_ns, profile_stat.st_size)
+    profile_id = _PROFILE_ID_CACHE.get(key)
+    if profile_id is None:
+        profile_id = _PROFILE_ID_CACHE[key] = _profile_id(profile)
+    return profile_id
+
+
+_VERSION_FULL_RE = re.compile(r"\d+\.\d+\.\d+")
+_VERSION_MAJOR_MINOR_RE = re.compile(r"\d+\.\d+")
+_VERSION_MAJOR_RE = re.compile(r"\d+")
+_VERSION_PREFIX_RE = re.compile(r"(\d+)\.(\d+)")
 
 
 def _select_python_version(target: Optional[str]) -> str:
@@ -87,25 +203,26 @@ def _select_python_version(target: Optional[str]) -> str:
         return DEFAULT_PYTHON_VERSION
 
     target = target.strip()
-    if re.match(r"^\d+\.\d+\.\d+$", target):
-        return target
-    if re.match(r"^\d+\.\d+$", target):
+    # Most profiles already carry "3.11" or "3.11.4"; accept those without
+    # touching the regexes (isdecimal matches the same characters as \d).
+    parts = target.split(".")
+    if 2 <= len(parts) <= 3 and all(part.isdecimal() for part in parts):
         return target
 
-    match = re.search(r"(\d+\.\d+\.\d+)", target)
+    match = _VERSION_FULL_RE.search(target)
     if match:
-        return match.group(1)
-    match = re.search(r"(\d+\.\d+)", target)
+        return match.group(0)
+    match = _VERSION_MAJOR_MINOR_RE.search(target)
     if match:
-        return match.group(1)
-    match = re.search(r"(\d+)", target)
+        return match.group(0)
+    match = _VERSION_MAJOR_RE.search(target)
     if match:
-        return f"{match.group(1)}.0"
+        return f"{match.group(0)}.0"
     return DEFAULT_PYTHON_VERSION
 
 
 def _needs_archive_unauth(python_target: str) -> bool:
-    match = re.match(r"^(\d+)\.(\d+)", python_target)
+    match = _VERSION_PREFIX_RE.match(python_target)
     if not match:
         return False
     major = int(match.group(1))
@@ -120,35 +237,43 @@ def _default_tmp_dir(repo_dir: Path) -> Path:
     return repo_dir / DEFAULT_TMP_DIR_NAME
 
 
+# Base image repo digests seen this process. Base tags are shared by every
+# profile with the same python target, so batch runs inspect each one once.
+_BASE_IMAGE_DIGEST_CACHE: dict[str, str] = {}
+
+
 def _image_digest(client, tag: str) -> Optional[str]:
+    digest = _BASE_IMAGE_DIGEST_CACHE.get(tag)
+    if digest is not None:
+        return digest
     try:
         image = client.images.get(tag)
     except DockerException:
         return None
     digests = image.attrs.get("RepoDigests") or []
-    return digests[0] if digests else None
+    if not digests:
+        return None
+    _BASE_IMAGE_DIGEST_CACHE[tag] = digests[0]
+    return digests[0]
 
 
-def _parse_dataset_info(repo_dir: Path) -> dict[str, Optional[str]]:
+@functools.lru_cache(maxsize=128)
+def _dataset_location(repo_dir: Path) -> tuple[dict[str, Optional[str]], Path]:
+    # Dataset key fields and the unsupported registry path from one scan of
+    # repo_dir.parts. Callers must not mutate the cached dict.
     parts = repo_dir.parts
     if "bugsinpy" in parts:
         idx = parts.index("bugsinpy")
         if len(parts) > idx + 3:
-            return {
+            info = {
                 "dataset": "bugsinpy",
                 "project": parts[idx + 1],
                 "bug_id": parts[idx + 2],
                 "variant": parts[idx + 3],
             }
-    return {"dataset": None, "project": None, "bug_id": None, "variant": None}
-
-
-def _unsupported_registry_path(repo_dir: Path) -> Path:
-    info = _parse_dataset_info(repo_dir)
-    if info.get("dataset") == "bugsinpy":
-        root = Path(*repo_dir.parts[: repo_dir.parts.index("bugsinpy") + 1])
-        return root / "unsupported_registry.json"
-    return repo_dir / ".pf_manifest" / "unsupported_registry.json"
+            return info, Path(*parts[: idx + 1]) / "unsupported_registry.json"
+    info = {"dataset": None, "project": None, "bug_id": None, "variant": None}
+    return info, repo_dir / ".pf_manifest" / "unsupported_registry.json"
 
 
 def _classify_build_failure(log_text: str, error_text: str) -> tuple[str, str, str, bool]:
@@ -165,7 +290,9 @@ def _classify_build_failure(log_text: str, error_text: str) -> tuple[str, str, s
         return "platform_incompatible_dependency", "dataset_metadata_issue", "platform_incompatible_dependency", False
     if "no matching distribution found" in lower or "could not find a version that satisfies the requirement" in lower:
         return "invalid_requirement", "dataset_metadata_issue", "invalid_requirement", False
-    if "apt-get" in lower and "non-zero code" in lower:
+    if "apt-get" in lower and (
+        "non-zero code" in lower or "did not complete successfully" in lower
+    ):
         return "apt_failure", "infra_issue", "apt_failure", True
     return "build_failure", "infra_issue", "build_failure", True
 
@@ -181,7 +308,7 @@ def _update_build_registry(
 ) -> None:
     if actionability not in {"dataset_metadata_issue", "infra_issue"}:
         return
-    info = _parse_dataset_info(repo_dir)
+    info, registry_path = _dataset_location(repo_dir)
     key = {
         "dataset": info.get("dataset") or "unknown",
         "project": info.get("project") or repo_dir.name,
@@ -194,11 +321,10 @@ def _update_build_registry(
         "stage": "image_build",
         "policy_profile": profile.get("policy_profile"),
     }
-    registry_path = _unsupported_registry_path(repo_dir)
     registry = {"entries": []}
     if registry_path.exists():
         try:
-            registry = json.loads(registry_path.read_text(encoding="utf-8"))
+            registry = _read_json(registry_path)
         except Exception:
             registry = {"entries": []}
     entries = registry.get("entries") or []
@@ -240,97 +366,234 @@ def _update_build_registry(
             }
         )
     registry["entries"] = entries
-    registry_path.parent.mkdir(parents=True, exist_ok=True)
-    _atomic_write_text(registry_path, json.dumps(registry, indent=2))
+    # Entries keep their insertion order, matching what gates-run writes.
+    _atomic_write_json(registry_path, registry, sort_keys=False, fsync=True)
+
+
+_REQUIREMENTS_INSTALL_RE = re.compile(
+    r"(?:python(?:3(?:\.\d+)?)?\s+-m\s+)?pip3?\s+install"
+    r"(?:\s+(?:-U|--upgrade|-q|--quiet|--no-cache-dir))*"
+    r"\s+(?:-r|--requirement)\s+([\w./-]+)"
+)
+_SAFE_REQUIREMENT_OPTIONS = frozenset(
+    {
+        "-i",
+        "--index-url",
+        "--extra-index-url",
+        "--trusted-host",
+        "--pre",
+        "--only-binary",
+        "--no-binary",
+        "--prefer-binary",
+    }
+)
+
+
+@dataclass(slots=True)
+class _InstallPlan:
+    copy_files: list[str]
+    pre_copy_cmds: list[str]
+    post_copy_cmds: list[str]
+
+
+def _requirements_only(req_path: Path) -> bool:
+    # True when installing the file cannot pull anything from the repo itself
+    # (editables, local paths, nested -r/-c includes), so it can run before
+    # the source tree is copied in.
+    try:
+        text = req_path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("-"):
+            option = line.split()[0].split("=", 1)[0]
+            if option in _SAFE_REQUIREMENT_OPTIONS:
+                continue
+            return False
+        if line.startswith((".", "/", "~")) or "file:" in line:
+            return False
+        if "/" in line and "://" not in line:
+            return False
+    return True
+
+
+def _plan_install(run_cmds: list[str], repo_dir: Path) -> _InstallPlan:
+    # Only a leading run of `pip install -r <file>` commands moves ahead of
+    # `COPY .`; everything from the first other command keeps its order after
+    # the copy, so source-only edits reuse the dependency layers.
+    copy_files: list[str] = []
+    split = 0
+    for cmd in run_cmds:
+        match = _REQUIREMENTS_INSTALL_RE.fullmatch(cmd)
+        if not match:
+            break
+        rel = match.group(1)
+        if rel.startswith("/") or ".." in rel.split("/"):
+            break
+        if not _requirements_only(repo_dir / rel):
+            break
+        if rel not in copy_files:
+            copy_files.append(rel)
+        split += 1
+    return _InstallPlan(copy_files, run_cmds[:split], run_cmds[split:])
 
 
 def _normalize_env(env: dict[str, str]) -> list[tuple[str, str]]:
-    return sorted(((key, str(value)) for key, value in env.items()), key=lambda item: item[0])
+    # Keys are unique, so the natural tuple order is the key order.
+    if not env:
+        return []
+    items = [(key, str(value)) for key, value in env.items()]
+    items.sort()
+    return items
+
+
+# One pinged client per process: from_env() parses TLS config and opens a
+# connection, and ping() costs a round trip, so neither is repeated.
+_CLIENT = None
 
 
 def _docker_available() -> bool:
-    if docker is None:
-        return False
+    # Callers ask this before doing any work, so re-ping a cached client
+    # rather than trusting it; a daemon that went away drops the cache.
+    if _CLIENT is not None:
+        try:
+            _CLIENT.ping()
+            return True
+        except (DockerException, OSError):
+            _reset_docker_client()
     try:
-        client = docker.from_env()
-        client.ping()
+        _get_docker_client()
         return True
-    except DockerException:
+    except RuntimeError:
         return False
 
 
+def _reset_docker_client() -> None:
+    global _CLIENT
+    _CLIENT = None
+
+
 def _get_docker_client():
+    global _CLIENT
+    if _CLIENT is not None:
+        return _CLIENT
     if docker is None:
         raise RuntimeError("docker SDK for Python is not installed.")
     try:
         client = docker.from_env()
         client.ping()
-        return client
     except DockerException as exc:
         raise RuntimeError("Docker is not available.") from exc
+    _CLIENT = client
+    return client
 
 
-def _atomic_write_text(path: Path, content: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp_path = None
+def _atomic_write_text(
+    path: Path, content: str, fsync: bool = False, ensure_parent: bool = True
+) -> None:
+    _atomic_write_bytes(path, content.encode("utf-8"), fsync=fsync, ensure_parent=ensure_parent)
+
+
+def _atomic_write_bytes(
+    path: Path, content: bytes, fsync: bool = False, ensure_parent: bool = True
+) -> None:
+    # Build artifacts (Dockerfiles, logs, manifest) are regenerated on the next
+    # run, so only callers persisting accumulated state ask for fsync.
+    if ensure_parent:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _temp_path(path)
     try:
-        with tempfile.NamedTemporaryFile(
-            "w",
-            encoding="utf-8",
-            dir=path.parent,
-            delete=False,
-            prefix=f".{path.name}.",
-            suffix=".tmp",
-        ) as handle:
-            handle.write(content)
-            handle.flush()
-            os.fsync(handle.fileno())
-            tmp_path = Path(handle.name)
+        _write_file(tmp_path, content, fsync)
         os.replace(tmp_path, path)
+    except BaseException:
+        _unlink_quietly(tmp_path)
+        raise
+
+
+def _atomic_write_many(items: list[tuple[Path, bytes]]) -> None:
+    # Write every temp file before replacing any target, then replace in
+    # order, so a failed write leaves all targets untouched. Callers list
+    # files that describe other files (sidecars, manifests) last.
+    pending: list[tuple[Path, Path]] = []
+    try:
+        for path, content in items:
+            tmp_path = _temp_path(path)
+            pending.append((tmp_path, path))
+            _write_file(tmp_path, content, False)
+        while pending:
+            tmp_path, path = pending[0]
+            os.replace(tmp_path, path)
+            pending.pop(0)
+    except BaseException:
+        for tmp_path, _ in pending:
+            _unlink_quietly(tmp_path)
+        raise
+
+
+def _temp_path(path: Path) -> Path:
+    # A pid/thread-unique name replaces tempfile's randomised retry loop; a
+    # stale file left by a killed writer with the same pid is truncated.
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _write_file(path: Path, content: bytes, fsync: bool) -> None:
+    data = memoryview(content)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+        if fsync:
+            os.fsync(fd)
     finally:
-        if tmp_path and tmp_path.exists():
-            try:
-                tmp_path.unlink()
-            except OSError:
-                pass
+        os.close(fd)
+
+
+def _unlink_quietly(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
 
 
-def _atomic_write_json(path: Path, payload: dict[str, Any]) -> None:
-    _atomic_write_text(path, json.dumps(payload, indent=2, sort_keys=True))
+def _atomic_write_json(
+    path: Path, payload: dict[str, Any], sort_keys: bool = True, fsync: bool = False
+) -> None:
+    _atomic_write_bytes(path, _dumps(payload, sort_keys=sort_keys), fsync=fsync)
+
+
+# ENV values are emitted double-quoted; a backslash left unescaped would eat
+# the character after it (or the closing quote).
+_ENV_ESCAPE = str.maketrans({"\"": "\\\"", "\\": "\\\\"})
+_ARCHIVE_APT_LINES = (
+    "RUN sed -i 's|deb.debian.org/debian|archive.debian.org/debian|g' /etc/apt/sources.list \\",
+    "    && sed -i 's|security.debian.org/debian-security|archive.debian.org/debian-security|g' /etc/apt/sources.list \\",
+    "    && sed -i '/-updates/d' /etc/apt/sources.list \\",
+    "    && echo 'Acquire::Check-Valid-Until \"false\";' > /etc/apt/apt.conf.d/99no-check-valid-until \\",
+    "    && echo 'Acquire::AllowInsecureRepositories \"true\";' > /etc/apt/apt.conf.d/99allow-insecure \\",
+    "    && echo 'Acquire::AllowDowngradeToInsecureRepositories \"true\";' >> /etc/apt/apt.conf.d/99allow-insecure",
+)
 
 
 def _dockerfile_content(
-    profile: dict[str, Any],
-    repo_dir: Path,
+    python_target: str,
+    env_items: list[tuple[str, str]],
+    install_plan: _InstallPlan,
     builder_tier: bool,
     use_archive_apt: bool,
     allow_unauth: bool,
 ) -> str:
-    python_target = _select_python_version(profile.get("python_version_target"))
-    install_cmds = profile.get("install_cmds") or []
-    if not isinstance(install_cmds, list):
-        raise RuntimeError("profile.install_cmds must be a list")
-
-    env = profile.get("env") or {}
-    if not isinstance(env, dict):
-        raise RuntimeError("profile.env must be a dict")
-
+    # Inputs arrive validated and normalized by build_container_image, which
+    # renders each variant a build stage needs from the same profile.
     packages = list(BASE_SYSTEM_PACKAGES)
     if builder_tier:
         packages.extend(BUILDER_SYSTEM_PACKAGES)
     system_packages = " ".join(packages)
     lines = [f"FROM python:{python_target}-slim"]
     if use_archive_apt:
-        lines.extend(
-            [
-                "RUN sed -i 's|deb.debian.org/debian|archive.debian.org/debian|g' /etc/apt/sources.list \\",
-                "    && sed -i 's|security.debian.org/debian-security|archive.debian.org/debian-security|g' /etc/apt/sources.list \\",
-                "    && sed -i '/-updates/d' /etc/apt/sources.list \\",
-                "    && echo 'Acquire::Check-Valid-Until \"false\";' > /etc/apt/apt.conf.d/99no-check-valid-until \\",
-                "    && echo 'Acquire::AllowInsecureRepositories \"true\";' > /etc/apt/apt.conf.d/99allow-insecure \\",
-                "    && echo 'Acquire::AllowDowngradeToInsecureRepositories \"true\";' >> /etc/apt/apt.conf.d/99allow-insecure",
-            ]
-        )
+        lines.extend(_ARCHIVE_APT_LINES)
     install_cmd = "apt-get install -y"
     if use_archive_apt and allow_unauth:
         install_cmd = "apt-get install -y --allow-unauthenticated"
@@ -341,141 +604,491 @@ def _dockerfile_content(
             f"{system_packages} \\"
             "\n    && rm -rf /var/lib/apt/lists/*",
             "WORKDIR /workspace",
-            "COPY . /workspace",
         ]
     )
 
-    for key, value in _normalize_env(env):
-        escaped = value.replace("\"", "\\\"")
-        lines.append(f"ENV {key}=\"{escaped}\"")
+    lines_append = lines.append
+    for key, value in env_items:
+        escaped = value.translate(_ENV_ESCAPE) if "\"" in value or "\\" in value else value
+        lines_append(f"ENV {key}=\"{escaped}\"")
 
-    for cmd in install_cmds:
-        cmd = cmd.strip()
-        if cmd:
-            lines.append(f"RUN {cmd}")
+    for rel in install_plan.copy_files:
+        lines_append(f"COPY {rel} /workspace/{rel}")
+    for cmd in install_plan.pre_copy_cmds:
+        lines_append(f"RUN {cmd}")
+    lines_append("COPY . /workspace")
+    for cmd in install_plan.post_copy_cmds:
+        lines_append(f"RUN {cmd}")
 
     lines.append("")
     return "\n".join(lines)
 
 
+def _read_dockerfile_digests(digest_path: Path) -> dict[str, str]:
+    # sha256sum format: "<hex>  <variant>" for each variant written so far.
+    digests: dict[str, str] = {}
+    try:
+        text = digest_path.read_text(encoding="utf-8")
+    except OSError:
+        return digests
+    for line in text.splitlines():
+        digest, sep, name = line.partition("  ")
+        if sep:
+            digests[name] = digest
+    return digests
+
+
+def _write_dockerfile_digests(digest_path: Path, digests: dict[str, str]) -> None:
+    content = "".join(f"{digest}  {name}\n" for name, digest in sorted(digests.items()))
+    _atomic_write_text(digest_path, content, ensure_parent=False)
+
+
+def _file_has_content(path: Path, content: bytes) -> bool:
+    try:
+        if path.stat().st_size != len(content):
+            return False
+        return path.read_bytes() == content
+    except OSError:
+        return False
+
+
+# One alternation per predicate so the engine walks the (possibly large) build
+# log once instead of once per signature.
+_BUILDER_RETRY_RE = re.compile(
+    r"longintrepr\.h"
+    r"|Python\.h"
+    r"|fatal error: .*: No such file or directory"
+    r"|Could not build wheels for (?:cffi|typed-ast|yarl)"
+)
+_ARCHIVE_RETRY_RE = re.compile(
+    r"does not have a Release file"
+    r"|404  Not Found"
+    r"|Err:.*debian.*Release"
+    r"|Err:.*security\.debian\.org"
+)
+_UNAUTH_RETRY_MARKERS = ("unauthenticated packages", "no_pubkey", "not signed", "expkeysig")
+_UNAUTH_RETRY_RE = re.compile(
+    "|".join(re.escape(marker) for marker in _UNAUTH_RETRY_MARKERS), re.IGNORECASE
+)
+
+
 def _should_retry_with_builder(log_text: str) -> bool:
-    patterns = [
-        r"longintrepr\.h",
-        r"Python\.h",
-        r"fatal error: .*: No such file or directory",
-        r"Could not build wheels for cffi",
-        r"Could not build wheels for typed-ast",
-        r"Could not build wheels for yarl",
-    ]
-    for pattern in patterns:
-        if re.search(pattern, log_text):
-            return True
-    return False
+    return _BUILDER_RETRY_RE.search(log_text) is not None
 
 
 def _should_retry_with_archive(log_text: str) -> bool:
-    patterns = [
-        r"does not have a Release file",
-        r"404  Not Found",
-        r"Err:.*debian.*Release",
-        r"Err:.*security\.debian\.org",
-    ]
-    for pattern in patterns:
-        if re.search(pattern, log_text):
-            return True
-    return False
+    return _ARCHIVE_RETRY_RE.search(log_text) is not None
 
 
 def _should_retry_with_unauth(log_text: str) -> bool:
-    patterns = [
-        r"unauthenticated packages",
-        r"no_pubkey",
-        r"not signed",
-        r"EXPKEYSIG",
-    ]
-    for pattern in patterns:
-        if re.search(pattern, log_text, re.IGNORECASE):
-            return True
-    return False
+    # IGNORECASE disables re's literal prefilter (~20x slower on multi-MB logs).
+    # For ASCII text (an O(1) check) lowercase substring search is equivalent;
+    # only non-ASCII logs need Unicode case folding.
+    if log_text.isascii():
+        lowered = log_text.lower()
+        return any(marker in lowered for marker in _UNAUTH_RETRY_MARKERS)
+    return _UNAUTH_RETRY_RE.search(log_text) is not None
 
 
-def _image_exists(client, tag: str) -> bool:
+def _get_image(client, tag: str):
     try:
-        client.images.get(tag)
-        return True
+        return client.images.get(tag)
     except ImageNotFound:
-        return False
+        return None
     except DockerException:
-        return False
+        return None
 
 
-def _load_image_cache(client, cache_path: Path) -> bool:
-    if not cache_path.exists():
-        return False
+def _image_exists(client, tag: str) -> bool:
+    return _get_image(client, tag) is not None
+
+
+def _image_exists_cached(client, tag: str, cache: dict[str, Any]) -> bool:
+    # One daemon round trip per tag until the caller invalidates the entry
+    # (after loading a cache tar or building).
+    if tag not in cache:
+        cache[tag] = _get_image(client, tag)
+    return cache[tag] is not None
+
+
+_SAVE_BUFFER_SIZE = 1024 * 1024
+_SAVE_FLUSH_SIZE = 4 * 1024 * 1024
+
+
+def _prefetch_image_cache(cache_path: Path) -> Optional[threading.Event]:
+    # Warm the page cache with the tar while the daemon answers the existence
+    # check; set the returned event to stop after the current block (e.g. when
+    # the image already exists and the tar is never loaded).
+    if not cache_path.is_file():
+        return None
+    stop = threading.Event()
+
+    def _warm() -> None:
+        buffer = bytearray(_SAVE_BUFFER_SIZE)
+        try:
+            with open(cache_path, "rb", buffering=0) as handle:
+                while not stop.is_set() and handle.readinto(buffer):
+                    pass
+        except OSError:
+            pass
+
+    threading.Thread(target=_warm, name="image-cache-prefetch", daemon=True).start()
+    return stop
+
+
+def _load_image_cache(client, cache_path: Path, tag: str):
+    # Returns the loaded image carrying `tag`, read from the load response
+    # so no follow-up images.get is needed.
     try:
-        data = cache_path.read_bytes()
-        client.images.load(data)
-        return True
-    except DockerException:
+        # images.load accepts a file object and streams it to the daemon in
+        # http.client-sized blocks; an unbuffered handle skips a copy per block.
+        handle = open(cache_path, "rb", buffering=0)
+    except OSError:
+        return None
+    with handle:
+        try:
+            images = client.images.load(handle)
+        except DockerException:
+            return None
+    for image in images or []:
+        if tag in (image.tags or []):
+            return image
+    return None
+
+
+def _save_image_cache(client, tag: str, cache_path: Path, image=None) -> None:
+    if image is None:
+        image = _get_image(client, tag)
+    if image is None:
+        return
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # image.save() yields small chunks; coalesce them so multi-GB tars go out in
+    # large writes, and rename into place so a partial tar never looks cached.
+    tmp_path = cache_path.with_suffix(".tar.tmp")
+    try:
+        with open(tmp_path, "wb", buffering=_SAVE_BUFFER_SIZE) as handle:
+            pending = bytearray()
+            for chunk in image.save(named=True):
+                pending += chunk
+                if len(pending) >= _SAVE_FLUSH_SIZE:
+                    handle.write(pending)
+                    pending.clear()
+            if pending:
+                handle.write(pending)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def _read_dockerignore(repo_dir: Path) -> list[str]:
+    try:
+        text = (repo_dir / ".dockerignore").read_text(encoding="utf-8")
+    except OSError:
+        return []
+    patterns = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            patterns.append(line)
+    return patterns
+
+
+def _make_build_context(repo_dir: Path):
+    # Tar the repo once per build_container_image call instead of letting the
+    # SDK re-walk it for every retry. Dockerfile variants on disk are left out;
+    # each stage appends the one it builds (_add_to_build_context), even if
+    # .dockerignore excludes .pf_manifest.
+    patterns = _read_dockerignore(repo_dir)
+    patterns.extend(f"{IMAGE_BUILD_DIR_REL}/{name}" for name in _DOCKERFILE_VARIANTS)
+    context = tempfile.TemporaryFile()
+    try:
+        with tarfile.open(fileobj=context, mode="w") as tar:
+            for rel in sorted(exclude_paths(str(repo_dir), patterns)):
+                tar.add(os.path.join(repo_dir, rel), arcname=rel, recursive=False)
+    except BaseException:
+        context.close()
+        raise
+    return context
+
+
+def _close_context_future(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _add_to_build_context(context, rel: str, data: bytes) -> None:
+    context.seek(0)
+    with tarfile.open(fileobj=context, mode="a") as tar:
+        info = tarfile.TarInfo(rel)
+        info.size = len(data)
+        info.mode = 0o644
+        tar.addfile(info, io.BytesIO(data))
+
+
+_BUILD_LOG_BUFFER_SIZE = 64 * 1024
+_BUILD_LOG_FLUSH_SIZE = 32 * 1024
+
+
+def _iter_build_entries(chunks):
+    # The daemon sends one JSON object per line, so split raw chunks on
+    # newlines and decode each line with orjson instead of the SDK's
+    # incremental stdlib decoder. Non-chunked responses can come back as str.
+    pending = b""
+    for chunk in chunks:
+        pending += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _loads(line)
+    if pending.strip():
+        yield _loads(pending)
+
+
+# `docker buildx` availability, probed once per process.
+_BUILDX_AVAILABLE: Optional[bool] = None
+
+
+def _buildx_available() -> bool:
+    global _BUILDX_AVAILABLE
+    if os.environ.get("PF_USE_BUILDX", "1") == "0":
         return False
+    if _BUILDX_AVAILABLE is None:
+        available = False
+        if shutil.which("docker"):
+            try:
+                result = subprocess.run(
+                    ["docker", "buildx", "version"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=30,
+                )
+                available = result.returncode == 0
+            except (OSError, subprocess.SubprocessError):
+                available = False
+        _BUILDX_AVAILABLE = available
+    return _BUILDX_AVAILABLE
 
 
-def _save_image_cache(client, tag: str, cache_path: Path) -> None:
+def _buildx_env() -> dict[str, str]:
+    # The SDK client ignores CLI contexts and defaults to the local socket;
+    # pin the CLI to the same daemon so the built image is the one we check.
+    env = dict(os.environ)
+    env.setdefault("DOCKER_HOST", "unix:///var/run/docker.sock")
+    return env
+
+
+def _build_image_buildx(
+    context,
+    dockerfile_rel: str,
+    tag: str,
+    log_handle,
+    log_sink: list[str],
+    force_rebuild: bool,
+) -> None:
+    # BuildKit via the CLI, fed the same context tar on stdin. Plain progress
+    # output carries the RUN output the retry predicates look for. No
+    # --cache-from: our cache_from tags are local-only, and buildx would look
+    # them up as registry refs. BuildKit reuses layers from its local store.
+    cmd = [
+        "docker",
+        "buildx",
+        "build",
+        "--load",
+        "--progress=plain",
+        "--build-arg",
+        "BUILDKIT_INLINE_CACHE=1",
+        "-f",
+        dockerfile_rel,
+        "-t",
+        tag,
+    ]
+    if force_rebuild:
+        cmd.append("--no-cache")
+    cmd.append("-")
+    context.seek(0)
+    pending = bytearray()
     try:
-        image = client.images.get(tag)
-    except DockerException:
+        process = subprocess.Popen(
+            cmd,
+            stdin=context,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=_buildx_env(),
+        )
+    except OSError as exc:
+        raise RuntimeError("Docker build failed.") from exc
+    try:
+        for line in process.stdout:
+            log_sink.append(line.decode("utf-8", errors="replace"))
+            pending += line
+            if len(pending) >= _BUILD_LOG_FLUSH_SIZE:
+                log_handle.write(pending)
+                pending.clear()
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        if pending:
+            log_handle.write(pending)
+    if returncode != 0:
+        # BuildKit reports the failing step as `process "..." did not complete
+        # successfully: exit code: N`; carry it like the legacy builder's error.
+        failed = next(
+            (
+                line.strip()
+                for line in reversed(log_sink)
+                if "did not complete successfully" in line
+            ),
+            None,
+        )
+        raise RuntimeError(f"Docker build failed: {failed}" if failed else "Docker build failed.")
+
+
+DEFAULT_MAX_CONCURRENT_BUILDS = 2
+_BUILD_LOCK_POLL_SECONDS = 0.5
+_BUILD_SEMAPHORE: Optional[threading.BoundedSemaphore] = None
+_BUILD_SEMAPHORE_LOCK = threading.Lock()
+
+
+def _max_concurrent_builds() -> int:
+    raw = os.environ.get("PF_MAX_CONCURRENT_BUILDS")
+    if not raw:
+        return DEFAULT_MAX_CONCURRENT_BUILDS
+    try:
+        return int(raw)
+    except ValueError:
+        return DEFAULT_MAX_CONCURRENT_BUILDS
+
+
+def _build_semaphore(limit: int) -> threading.BoundedSemaphore:
+    # Sized by the first build in the process.
+    global _BUILD_SEMAPHORE
+    with _BUILD_SEMAPHORE_LOCK:
+        if _BUILD_SEMAPHORE is None:
+            _BUILD_SEMAPHORE = threading.BoundedSemaphore(limit)
+        return _BUILD_SEMAPHORE
+
+
+def _acquire_build_lock(lock_dir: Path, limit: int):
+    # One flock'd file per slot; the returned handle holds the slot until
+    # closed. Returns None where flock is unavailable.
+    if fcntl is None:
+        return None
+    try:
+        lock_dir.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    while True:
+        for slot in range(limit):
+            try:
+                handle = open(lock_dir / f"build-{slot}.lock", "ab")
+            except OSError:
+                return None
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except BlockingIOError:
+                handle.close()
+        time.sleep(_BUILD_LOCK_POLL_SECONDS)
+
+
+@contextlib.contextmanager
+def _build_slot(lock_dir: Path):
+    # Concurrent legacy builds against one daemon are slower than running
+    # them in turn, so cap them per process (semaphore) and across worker
+    # processes sharing lock_dir (flock). BuildKit schedules its own work,
+    # so buildx builds are not limited.
+    limit = _max_concurrent_builds()
+    if limit < 1 or _buildx_available():
+        yield
         return
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(cache_path, "wb") as handle:
-        for chunk in image.save(named=True):
-            handle.write(chunk)
+    with _build_semaphore(limit):
+        handle = _acquire_build_lock(lock_dir, limit)
+        try:
+            yield
+        finally:
+            if handle is not None:
+                handle.close()
 
 
 def _build_image(
     client,
-    repo_dir: Path,
+    context,
     dockerfile_rel: str,
     tag: str,
-    build_log_path: Path,
+    log_handle,
+    log_sink: list[str],
     cache_from: Optional[list[str]],
     force_rebuild: bool,
     ) -> None:
-    build_log_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(build_log_path, "w", encoding="utf-8") as handle:
-        try:
-            output = client.api.build(
-                path=str(repo_dir),
-                dockerfile=dockerfile_rel,
-                tag=tag,
-                decode=True,
-                rm=True,
-                forcerm=True,
-                nocache=force_rebuild,
-                cache_from=cache_from or None,
-            )
-            for entry in output:
-                if "stream" in entry:
-                    handle.write(entry["stream"])
-                if "error" in entry:
-                    raise RuntimeError(entry["error"])
-        except (BuildError, APIError, DockerException) as exc:
-            raise RuntimeError("Docker build failed.") from exc
+    if _buildx_available():
+        _build_image_buildx(context, dockerfile_rel, tag, log_handle, log_sink, force_rebuild)
+        return
+    context.seek(0)
+    # Build output arrives as many small stream entries; batch them into
+    # large binary writes rather than one write per line, and hand the text
+    # to the caller through log_sink.
+    pending = bytearray()
+    try:
+        output = client.api.build(
+            fileobj=context,
+            custom_context=True,
+            dockerfile=dockerfile_rel,
+            tag=tag,
+            decode=orjson is None,
+            rm=True,
+            forcerm=True,
+            nocache=force_rebuild,
+            cache_from=cache_from or None,
+        )
+        if orjson is not None:
+            output = _iter_build_entries(output)
+        for entry in output:
+            stream = entry.get("stream")
+            if stream is not None:
+                log_sink.append(stream)
+                pending += stream.encode("utf-8")
+                if len(pending) >= _BUILD_LOG_FLUSH_SIZE:
+                    log_handle.write(pending)
+                    pending.clear()
+            error = entry.get("error")
+            if error is not None:
+                raise RuntimeError(error)
+    except (BuildError, APIError, DockerException) as exc:
+        raise RuntimeError("Docker build failed.") from exc
+    finally:
+        if pending:
+            log_handle.write(pending)
 
 
 def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
     repo_dir = Path(request.repo_dir).resolve()
-    if not repo_dir.exists():
-        raise FileNotFoundError(f"Repo dir '{repo_dir}' does not exist.")
-    if not repo_dir.is_dir():
+    # One stat per input instead of exists() followed by is_dir()/stat().
+    try:
+        repo_stat = os.stat(repo_dir)
+    except OSError:
+        raise FileNotFoundError(f"Repo dir '{repo_dir}' does not exist.") from None
+    if not stat.S_ISDIR(repo_stat.st_mode):
         raise NotADirectoryError(f"Repo dir '{repo_dir}' is not a directory.")
 
     profile_path = Path(request.profile_path)
-    if not profile_path.exists():
-        raise FileNotFoundError(f"Profile path '{profile_path}' does not exist.")
-
+    # Stat before reading so a concurrent rewrite can never be cached under
+    # the new file's key.
+    try:
+        profile_stat = os.stat(profile_path)
+    except OSError:
+        raise FileNotFoundError(f"Profile path '{profile_path}' does not exist.") from None
     payload = _read_json(profile_path)
     profile = payload.get("profile") or payload
-    profile_id = payload.get("profile_id") or _profile_id(profile)
+    profile_id = payload.get("profile_id") or _cached_profile_id(
+        profile_path, profile_stat, profile
+    )
 
     status = profile.get("status")
     if status == "unsupported":
@@ -506,44 +1119,17 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
         raise RuntimeError("Profile has no install_cmds.")
 
     image_tag = f"patchfoundry/{profile_id}:latest"
-    artifacts_dir = repo_dir / ".pf_manifest" / "image_build"
+    artifacts_dir = repo_dir / IMAGE_BUILD_DIR_REL
     manifest_path = artifacts_dir / "manifest.json"
-    dockerfile_path = artifacts_dir / "Dockerfile"
-    dockerfile_builder_path = artifacts_dir / "Dockerfile.builder"
-    dockerfile_archive_path = artifacts_dir / "Dockerfile.archive"
-    dockerfile_archive_unauth_path = artifacts_dir / "Dockerfile.archive-unauth"
-    dockerfile_builder_archive_path = artifacts_dir / "Dockerfile.builder-archive"
-    dockerfile_builder_archive_unauth_path = artifacts_dir / "Dockerfile.builder-archive-unauth"
     python_target = _select_python_version(profile.get("python_version_target"))
+    if not isinstance(install_cmds, list):
+        raise RuntimeError("profile.install_cmds must be a list")
+    env = profile.get("env") or {}
+    if not isinstance(env, dict):
+        raise RuntimeError("profile.env must be a dict")
     base_image_tag = f"python:{python_target}-slim"
     allow_unauthenticated_apt = bool(profile.get("allow_unauthenticated_apt", True))
     archive_allow_unauth = _needs_archive_unauth(python_target) and allow_unauthenticated_apt
-    dockerfile_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=False, use_archive_apt=False, allow_unauth=False
-    )
-    dockerfile_builder_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=True, use_archive_apt=False, allow_unauth=False
-    )
-    dockerfile_archive_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=False, use_archive_apt=True, allow_unauth=False
-    )
-    dockerfile_archive_unauth_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=False, use_archive_apt=True, allow_unauth=True
-    )
-    dockerfile_builder_archive_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=True, use_archive_apt=True, allow_unauth=False
-    )
-    dockerfile_builder_archive_unauth_content = _dockerfile_content(
-        profile, repo_dir, builder_tier=True, use_archive_apt=True, allow_unauth=True
-    )
-    _atomic_write_text(dockerfile_path, dockerfile_content)
-    _atomic_write_text(dockerfile_builder_path, dockerfile_builder_content)
-    _atomic_write_text(dockerfile_archive_path, dockerfile_archive_content)
-    _atomic_write_text(dockerfile_archive_unauth_path, dockerfile_archive_unauth_content)
-    _atomic_write_text(dockerfile_builder_archive_path, dockerfile_builder_archive_content)
-    _atomic_write_text(
-        dockerfile_builder_archive_unauth_path, dockerfile_builder_archive_unauth_content
-    )
 
     client = _get_docker_client()
 
@@ -553,8 +1139,13 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
         cache_dir = Path(request.image_cache_dir)
     else:
         cache_dir = _default_tmp_dir(repo_dir) / "image-cache"
-    if not request.force_rebuild and _image_exists(client, image_tag):
-        _atomic_write_text(build_log_path, f"Reused existing image {image_tag}.\n")
+    prefetch_stop = None
+    if cache_dir:
+        prefetch_stop = _prefetch_image_cache(cache_dir / f"{profile_id}.tar")
+    image_cache: dict[str, Any] = {}
+    if not request.force_rebuild and _image_exists_cached(client, image_tag, image_cache):
+        if prefetch_stop is not None:
+            prefetch_stop.set()
         manifest_payload = {}
         if manifest_path.exists():
             try:
@@ -580,7 +1171,13 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
                 "policy_profile": policy_profile,
             }
         )
-        _atomic_write_json(manifest_path, manifest_payload)
+        artifacts_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write_many(
+            [
+                (build_log_path, f"Reused existing image {image_tag}.\n".encode("utf-8")),
+                (manifest_path, _dumps(manifest_payload)),
+            ]
+        )
         return ImageBuildResponse(
             image_tag=image_tag,
             profile_id=profile_id,
@@ -589,14 +1186,30 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
         )
 
     cache_from = []
-    if _image_exists(client, image_tag):
+    if _image_exists_cached(client, image_tag, image_cache):
         cache_from.append(image_tag)
 
+    context_future: Optional[Future] = None
+    if request.force_rebuild and cache_dir and (cache_dir / f"{profile_id}.tar").is_file():
+        # A forced build is certain, so tar the repo while the daemon loads
+        # the cached image rather than after it.
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="build-context")
+        context_future = executor.submit(_make_build_context, repo_dir)
+        executor.shutdown(wait=False)
+
     if cache_dir:
         cache_path = cache_dir / f"{profile_id}.tar"
-        loaded = _load_image_cache(client, cache_path)
-        if loaded and not request.force_rebuild and _image_exists(client, image_tag):
-            _atomic_write_text(build_log_path, f"Loaded cached image {image_tag}.\n")
+        try:
+            loaded_image = _load_image_cache(client, cache_path, image_tag)
+        except BaseException:
+            if context_future is not None:
+                context_future.add_done_callback(_close_context_future)
+            raise
+        if prefetch_stop is not None:
+            prefetch_stop.set()
+        if loaded_image is not None:
+            image_cache[image_tag] = loaded_image
+        if loaded_image is not None and not request.force_rebuild:
             manifest_payload = {}
             if manifest_path.exists():
                 try:
@@ -622,114 +1235,129 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
                     "policy_profile": policy_profile,
                 }
             )
-            _atomic_write_json(manifest_path, manifest_payload)
+            artifacts_dir.mkdir(parents=True, exist_ok=True)
+            _atomic_write_many(
+                [
+                    (build_log_path, f"Loaded cached image {image_tag}.\n".encode("utf-8")),
+                    (manifest_path, _dumps(manifest_payload)),
+                ]
+            )
             return ImageBuildResponse(
                 image_tag=image_tag,
                 profile_id=profile_id,
                 reused_cache=True,
                 build_log_path=str(build_log_path),
             )
-        if _image_exists(client, image_tag) and image_tag not in cache_from:
+        if _image_exists_cached(client, image_tag, image_cache) and image_tag not in cache_from:
             cache_from.append(image_tag)
 
-    dockerfile_rel = os.path.relpath(dockerfile_path, repo_dir)
-    builder_rel = os.path.relpath(dockerfile_builder_path, repo_dir)
-    archive_rel = os.path.relpath(dockerfile_archive_path, repo_dir)
-    archive_unauth_rel = os.path.relpath(dockerfile_archive_unauth_path, repo_dir)
-    builder_archive_rel = os.path.relpath(dockerfile_builder_archive_path, repo_dir)
-    builder_archive_unauth_rel = os.path.relpath(
-        dockerfile_builder_archive_unauth_path, repo_dir
-    )
+    # Dockerfile inputs are only needed once a build is certain; planning the
+    # install reads requirements files, which the reuse paths skip.
+    env_items = _normalize_env(env)
+    run_cmds = [cmd for cmd in (raw_cmd.strip() for raw_cmd in install_cmds) if cmd]
+    install_plan = _plan_install(run_cmds, repo_dir)
+
     build_variant = "standard"
     archive_used = False
     builder_used = False
     apt_security_mode = "standard"
+    build_context = None
+    # All stages append to one log handle. Each stage's own output is also
+    # kept in memory for the retry predicates, so the log is never read back.
+    stage_log = ""
+    artifacts_dir.mkdir(parents=True, exist_ok=True)
+    log_handle = open(build_log_path, "wb", buffering=_BUILD_LOG_BUFFER_SIZE)
+    # Dockerfile variants are rendered and written only when a stage builds
+    # them; the sidecar lets unchanged files skip the rewrite.
+    digest_path = artifacts_dir / "Dockerfile.sha256"
+    dockerfile_digests = _read_dockerfile_digests(digest_path)
+    recorded_digests = dict(dockerfile_digests)
+
+    def _prepare_dockerfile(variant: str) -> str:
+        builder_tier, use_archive_apt, allow_unauth = _DOCKERFILE_VARIANTS[variant]
+        content = _dockerfile_content(
+            python_target,
+            env_items,
+            install_plan,
+            builder_tier=builder_tier,
+            use_archive_apt=use_archive_apt,
+            allow_unauth=allow_unauth,
+        ).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        path = artifacts_dir / variant
+        # Content-addressed: a recorded digest skips the write outright; a
+        # missing or stale record (older sidecar, crashed run) falls back to
+        # comparing the bytes on disk before rewriting.
+        if dockerfile_digests.get(variant) != digest or not path.is_file():
+            if not _file_has_content(path, content):
+                _atomic_write_bytes(path, content, ensure_parent=False)
+            dockerfile_digests[variant] = digest
+        rel = f"{IMAGE_BUILD_DIR_REL}/{variant}"
+        _add_to_build_context(build_context, rel, content)
+        return rel
+
+    def _run_stage(variant: str, force_rebuild: bool, retry_note: Optional[str] = None) -> None:
+        nonlocal stage_log
+        if retry_note:
+            log_handle.write(f"\n[retry] {retry_note}\n".encode("utf-8"))
+        dockerfile_rel = _prepare_dockerfile(variant)
+        stage_output: list[str] = []
+        try:
+            with _build_slot(_default_tmp_dir(repo_dir)):
+                _build_image(
+                    client,
+                    build_context,
+                    dockerfile_rel,
+                    image_tag,
+                    log_handle,
+                    stage_output,
+                    cache_from=cache_from,
+                    force_rebuild=force_rebuild,
+                )
+        finally:
+            stage_log = "".join(stage_output)
+
     try:
+        if context_future is not None:
+            build_context = context_future.result()
+        else:
+            build_context = _make_build_context(repo_dir)
         try:
-            _build_image(
-                client,
-                repo_dir,
-                dockerfile_rel,
-                image_tag,
-                build_log_path,
-                cache_from=cache_from,
-                force_rebuild=request.force_rebuild,
-            )
+            _run_stage("Dockerfile", request.force_rebuild)
         except RuntimeError:
-            log_text = ""
-            try:
-                log_text = Path(build_log_path).read_text(
-                    encoding="utf-8", errors="ignore"
-                )
-            except OSError:
-                log_text = ""
+            log_text = stage_log
             if _should_retry_with_archive(log_text):
                 archive_used = True
                 if archive_allow_unauth:
                     apt_security_mode = "archive_unauthenticated"
                 else:
                     apt_security_mode = "archive"
-                _atomic_write_text(
-                    build_log_path,
-                    log_text
-                    + "\n[retry] detected apt repository errors; rebuilding with archive sources\n",
-                )
                 try:
-                    _build_image(
-                        client,
-                        repo_dir,
-                        archive_unauth_rel if archive_allow_unauth else archive_rel,
-                        image_tag,
-                        build_log_path,
-                        cache_from=cache_from,
-                        force_rebuild=True,
+                    _run_stage(
+                        "Dockerfile.archive-unauth" if archive_allow_unauth else "Dockerfile.archive",
+                        True,
+                        "detected apt repository errors; rebuilding with archive sources",
                     )
                     build_variant = "archive-unauth" if archive_allow_unauth else "archive"
                 except RuntimeError:
-                    retry_log = ""
-                    try:
-                        retry_log = Path(build_log_path).read_text(
-                            encoding="utf-8", errors="ignore"
-                        )
-                    except OSError:
-                        retry_log = ""
+                    retry_log = stage_log
                     if not archive_allow_unauth and _should_retry_with_unauth(retry_log):
                         apt_security_mode = "archive_unauthenticated"
-                        _atomic_write_text(
-                            build_log_path,
-                            retry_log
-                            + "\n[retry] detected unauthenticated archive packages; rebuilding with archive + unauthenticated\n",
-                        )
-                        _build_image(
-                            client,
-                            repo_dir,
-                            archive_unauth_rel,
-                            image_tag,
-                            build_log_path,
-                            cache_from=cache_from,
-                            force_rebuild=True,
+                        _run_stage(
+                            "Dockerfile.archive-unauth",
+                            True,
+                            "detected unauthenticated archive packages; rebuilding with archive + unauthenticated",
                         )
                         build_variant = "archive-unauth"
-                        retry_log = Path(build_log_path).read_text(
-                            encoding="utf-8", errors="ignore"
-                        )
+                        retry_log = stage_log
                     if _should_retry_with_builder(retry_log):
                         builder_used = True
-                        _atomic_write_text(
-                            build_log_path,
-                            retry_log
-                            + "\n[retry] detected missing headers; rebuilding with builder tier + archive sources\n",
-                        )
-                        _build_image(
-                            client,
-                            repo_dir,
-                            builder_archive_unauth_rel
+                        _run_stage(
+                            "Dockerfile.builder-archive-unauth"
                             if apt_security_mode == "archive_unauthenticated"
-                            else builder_archive_rel,
-                            image_tag,
-                            build_log_path,
-                            cache_from=cache_from,
-                            force_rebuild=True,
+                            else "Dockerfile.builder-archive",
+                            True,
+                            "detected missing headers; rebuilding with builder tier + archive sources",
                         )
                         build_variant = (
                             "builder-archive-unauth"
@@ -740,31 +1368,20 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
                         raise
             elif _should_retry_with_builder(log_text):
                 builder_used = True
-                _atomic_write_text(
-                    build_log_path,
-                    log_text
-                    + "\n[retry] detected missing headers; rebuilding with builder tier\n",
-                )
-                _build_image(
-                    client,
-                    repo_dir,
-                    builder_rel,
-                    image_tag,
-                    build_log_path,
-                    cache_from=cache_from,
-                    force_rebuild=True,
+                _run_stage(
+                    "Dockerfile.builder", True, "detected missing headers; rebuilding with builder tier"
                 )
                 build_variant = "builder"
             else:
                 raise
     except Exception as exc:
-        log_text = ""
-        try:
-            log_text = Path(build_log_path).read_text(encoding="utf-8", errors="ignore")
-        except OSError:
-            log_text = ""
+        if exc.__cause__ is not None or not isinstance(exc, RuntimeError):
+            # Not a failing build step; the daemon connection may be gone, so
+            # the next call pings a fresh client instead of reusing this one.
+            _reset_docker_client()
+        # Classify on the failing stage's output, as before.
         failure_reason, actionability, suggested, retry_on_policy_change = _classify_build_failure(
-            log_text, str(exc)
+            stage_log, str(exc)
         )
         _update_build_registry(
             repo_dir,
@@ -776,10 +1393,18 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
             report_path=build_log_path,
         )
         raise
+    finally:
+        log_handle.close()
+        if build_context is not None:
+            build_context.close()
+        if dockerfile_digests != recorded_digests:
+            _write_dockerfile_digests(digest_path, dockerfile_digests)
 
+    image_cache.pop(image_tag, None)
     if cache_dir:
         cache_path = cache_dir / f"{profile_id}.tar"
-        _save_image_cache(client, image_tag, cache_path)
+        _image_exists_cached(client, image_tag, image_cache)
+        _save_image_cache(client, image_tag, cache_path, image_cache[image_tag])
 
         base_image_digest = _image_digest(client, base_image_tag)
         _atomic_write_json(
@@ -808,7 +1433,7 @@ def build_container_image(request: ImageBuildRequest) -> ImageBuildResponse:
 
 
 if __name__ == "__main__":
-    raw = json.loads(sys.stdin.read())
-    req = ImageBuildRequest(**raw)
+    raw = _loads(sys.stdin.buffer.read())
+    req = ImageBuildRequest.from_dict(raw)
     resp = build_container_image(req)
-    print(json.dumps(_model_dump(resp), indent=2))
+    print(_dumps(_model_dump(resp), sort_keys=False).decode("utf-8"))
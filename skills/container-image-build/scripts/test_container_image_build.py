@@ -4,9 +4,15 @@ from pathlib import Path
 
 from container_image_build import (
     ImageBuildRequest,
+    _InstallPlan,
+    _classify_build_failure,
     _docker_available,
+    _dockerfile_content,
+    _plan_install,
     _profile_id,
+    _read_dockerfile_digests,
     _should_retry_with_builder,
+    _write_dockerfile_digests,
     build_container_image,
 )
 
@@ -61,3 +67,75 @@ def test_builder_retry_detection():
         "error: command '/usr/bin/gcc' failed with exit code 1\n"
     )
     assert _should_retry_with_builder(log) is True
+
+
+def test_buildkit_apt_failure_classification():
+    log = (
+        "#6 [2/5] RUN apt-get update && apt-get install -y libpq-dev\n"
+        "#6 1.204 E: Unable to locate package libpq-dev\n"
+        "#6 ERROR: process \"/bin/sh -c apt-get update && apt-get install -y libpq-dev\" "
+        "did not complete successfully: exit code: 100\n"
+    )
+    failure_reason, actionability, suggested, retry = _classify_build_failure(
+        log, "Docker build failed."
+    )
+    assert (failure_reason, actionability, suggested, retry) == (
+        "apt_failure",
+        "infra_issue",
+        "apt_failure",
+        True,
+    )
+    error = "Docker build failed: " + log.splitlines()[-1]
+    assert _classify_build_failure("", error)[0] == "apt_failure"
+
+
+def test_install_plan_moves_requirements_ahead_of_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        _write(repo / "requirements.txt", "pytest==7.4.0\nrequests>=2\n")
+        _write(repo / "requirements-dev.txt", "-e .\n")
+
+        plan = _plan_install(
+            [
+                "python -m pip install -r requirements.txt",
+                "pip install -e .",
+                "pip install -r requirements.txt",
+            ],
+            repo,
+        )
+        assert plan.copy_files == ["requirements.txt"]
+        assert plan.pre_copy_cmds == ["python -m pip install -r requirements.txt"]
+        assert plan.post_copy_cmds == ["pip install -e .", "pip install -r requirements.txt"]
+
+        plan = _plan_install(["pip install -r requirements-dev.txt"], repo)
+        assert plan.copy_files == []
+        assert plan.post_copy_cmds == ["pip install -r requirements-dev.txt"]
+
+
+def test_dockerfile_digests_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        digest_path = Path(tmp) / "Dockerfile.sha256"
+        assert _read_dockerfile_digests(digest_path) == {}
+
+        # The single-digest format written by older versions is ignored.
+        _write(digest_path, "ab" * 32 + "\n")
+        assert _read_dockerfile_digests(digest_path) == {}
+
+        digests = {"Dockerfile.builder": "cd" * 32, "Dockerfile": "ef" * 32}
+        _write_dockerfile_digests(digest_path, digests)
+        assert digest_path.read_text(encoding="utf-8").splitlines()[0].endswith("  Dockerfile")
+        assert _read_dockerfile_digests(digest_path) == digests
+
+
+def test_dockerfile_env_values_are_escaped():
+    content = _dockerfile_content(
+        "3.11",
+        [("A", "plain"), ("B", 'say "hi"'), ("C", "C:\\tmp\\")],
+        _InstallPlan([], [], ["pip install -e ."]),
+        builder_tier=False,
+        use_archive_apt=False,
+        allow_unauth=False,
+    )
+    assert 'ENV A="plain"' in content
+    assert 'ENV B="say \\"hi\\""' in content
+    assert 'ENV C="C:\\\\tmp\\\\"' in content
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import bisect
 import fnmatch
+import functools
 import hashlib
+import itertools
 import json
 import os
+import re
 import sys
-from copy import deepcopy
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 
 try:
     from pydantic import BaseModel, Field, ConfigDict
@@ -15,6 +18,16 @@ except Exception:  # pragma: no cover - pydantic v1
     from pydantic import BaseModel, Field
     ConfigDict = None
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional streaming parser
+    ijson = None
+
 try:
     from unidiff import PatchSet
 except Exception:  # pragma: no cover
@@ -35,6 +48,14 @@ EXCLUDE_PATTERNS = [
     ".system/**",
 ]
 EXCLUDE_CAP = 10
+# Gate reports at least this large are streamed with ijson when it is installed.
+STREAM_REPORT_BYTES = 32 * 1024 * 1024
+# Line boundaries str.splitlines() honours besides "\n", as UTF-8 bytes.
+_OTHER_LINE_BREAKS_RE = re.compile(rb"[\r\v\f\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+# Snippet kinds indexed by their sort code; codes follow the names'
+# alphabetical order so ties on (start, end) break as they always have.
+_SNIPPET_KINDS = ("ast_block", "gate_signal", "mutation_hunk")
+_KIND_AST_BLOCK, _KIND_GATE_SIGNAL, _KIND_MUTATION_HUNK = range(len(_SNIPPET_KINDS))
 _AST_AVAILABLE: Optional[bool] = None
 _AST_PARSER = None
 
@@ -76,15 +97,37 @@ def _model_dump(model: BaseModel) -> dict[str, Any]:
     return model.dict()
 
 
-def _stable_json(payload: dict[str, Any]) -> str:
-    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+def _orjson_sorted(payload: Any, indent: bool = False) -> Optional[bytes]:
+    # orjson writes non-ASCII and DEL (0x7f) raw where json escapes them, which
+    # would change bundle sizes and context ids; such payloads go through json.
+    if orjson is None:
+        return None
+    option = orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        data = orjson.dumps(payload, option=option)
+    except TypeError:
+        return None
+    if not data.isascii() or b"\x7f" in data:
+        return None
+    return data
+
+
+def _stable_json_bytes(payload: Any) -> bytes:
+    data = _orjson_sorted(payload)
+    if data is None:
+        data = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return data
 
 
 def _atomic_write_json(path: Path, payload: dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    data = json.dumps(payload, indent=2, sort_keys=True)
+    data = _orjson_sorted(payload, indent=True)
+    if data is None:
+        data = json.dumps(payload, indent=2, sort_keys=True).encode("utf-8")
     tmp_path = path.with_suffix(path.suffix + ".tmp")
-    tmp_path.write_text(data, encoding="utf-8")
+    tmp_path.write_bytes(data)
     os.replace(tmp_path, path)
 
 
@@ -96,15 +139,40 @@ def _strip_diff_prefix(path: str) -> str:
     return path
 
 
-def _matches_exclude(rel_path: Path, patterns: list[str]) -> Optional[str]:
-    rel = rel_path.as_posix()
-    for pattern in patterns:
-        if fnmatch.fnmatch(rel, pattern):
-            return pattern
-    return None
+@functools.lru_cache(maxsize=8)
+def _compile_excludes(patterns: tuple[str, ...]) -> re.Pattern[str]:
+    # One alternation instead of a fnmatch() call per pattern; the first
+    # alternative that matches wins, same as the old loop order.
+    return re.compile(
+        "|".join(
+            f"(?P<_x{idx}>{fnmatch.translate(os.path.normcase(pattern))})"
+            for idx, pattern in enumerate(patterns)
+        )
+    )
 
 
-def _resolve_path(repo_dir: Path, raw_path: str) -> Optional[Path]:
+def _matches_exclude(rel_path: str, patterns: list[str]) -> Optional[str]:
+    match = _compile_excludes(tuple(patterns)).match(os.path.normcase(rel_path))
+    if match is None:
+        return None
+    return next(pattern for idx, pattern in enumerate(patterns) if match.group(f"_x{idx}") is not None)
+
+
+def _path_exists(path: Path, cache: Optional[dict[str, bool]]) -> bool:
+    if cache is None:
+        return path.exists()
+    key = str(path)
+    exists = cache.get(key)
+    if exists is None:
+        exists = cache[key] = path.exists()
+    return exists
+
+
+def _resolve_path(
+    repo_dir: Path, raw_path: str, exists_cache: Optional[dict[str, bool]] = None
+) -> Optional[Path]:
+    # exists_cache lets one bundle build stat each candidate path only once,
+    # e.g. when a signal and a diff name the same file differently.
     if not raw_path:
         return None
     cleaned = _strip_diff_prefix(raw_path)
@@ -112,32 +180,49 @@ def _resolve_path(repo_dir: Path, raw_path: str) -> Optional[Path]:
     if candidate.is_absolute():
         try:
             candidate.relative_to(repo_dir)
-            return candidate if candidate.exists() else None
+            return candidate if _path_exists(candidate, exists_cache) else None
         except Exception:
             pass
     resolved = repo_dir / cleaned
-    if resolved.exists():
+    if _path_exists(resolved, exists_cache):
         return resolved
     if repo_dir.name in candidate.parts:
         parts = list(candidate.parts)
         idx = parts.index(repo_dir.name)
         alt = repo_dir.joinpath(*parts[idx + 1 :])
-        if alt.exists():
+        if _path_exists(alt, exists_cache):
             return alt
     return None
 
 
-def _load_gate_signals(gate_report_path: Path) -> list[dict[str, Any]]:
-    report = json.loads(gate_report_path.read_text(encoding="utf-8"))
-    signals: list[dict[str, Any]] = []
+def _iter_gate_signals(gate_report_path: Path) -> Iterator[dict[str, Any]]:
+    if ijson is not None and gate_report_path.stat().st_size >= STREAM_REPORT_BYTES:
+        # Streaming is slower than a full parse but keeps huge reports
+        # (embedded logs, thousands of signals) out of memory.
+        with gate_report_path.open("rb") as handle:
+            yield from ijson.items(handle, "runs.item.results.item.signals.item")
+        return
+    report = None
+    if orjson is not None:
+        try:
+            report = orjson.loads(gate_report_path.read_bytes())
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN/Infinity, which the stdlib parser accepts
+    if report is None:
+        report = json.loads(gate_report_path.read_text(encoding="utf-8"))
     for run in report.get("runs", []):
         for result in run.get("results", []):
-            for sig in result.get("signals", []) or []:
-                path = sig.get("path")
-                line = sig.get("line")
-                if not path or not isinstance(line, int):
-                    continue
-                signals.append({"path": path, "line": line, "tool": sig.get("tool")})
+            yield from result.get("signals", []) or []
+
+
+def _load_gate_signals(gate_report_path: Path) -> list[dict[str, Any]]:
+    signals: list[dict[str, Any]] = []
+    for sig in _iter_gate_signals(gate_report_path):
+        path = sig.get("path")
+        line = sig.get("line")
+        if not path or not isinstance(line, int):
+            continue
+        signals.append({"path": path, "line": line, "tool": sig.get("tool")})
     return signals
 
 
@@ -155,7 +240,7 @@ def _load_diff(mutation_diff_path: Path) -> tuple[list[dict[str, Any]], str, Opt
         hunks: list[dict[str, Any]] = []
         for hunk in patched_file:
             header = f"@@ -{hunk.source_start},{hunk.source_length} +{hunk.target_start},{hunk.target_length} @@"
-            body = "".join(f"{line.line_type}{line.value}" for line in hunk)
+            body = "".join([f"{line.line_type}{line.value}" for line in hunk])
             hunks.append(
                 {
                     "source_start": hunk.source_start,
@@ -169,30 +254,46 @@ def _load_diff(mutation_diff_path: Path) -> tuple[list[dict[str, Any]], str, Opt
     return files, "ok", None
 
 
-def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
-    if not ranges:
-        return []
-    ranges = sorted(ranges, key=lambda r: (r[0], r[1]))
-    merged = [ranges[0]]
-    for start, end in ranges[1:]:
-        last_start, last_end = merged[-1]
-        if start <= last_end + 1:
+def _merge_ranges_sorted(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    # One pass over ranges already ordered by (start, end).
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            last_start, last_end = merged[-1]
             merged[-1] = (last_start, max(last_end, end))
         else:
             merged.append((start, end))
     return merged
 
 
-def _read_lines(path: Path) -> list[str]:
-    return path.read_text(encoding="utf-8", errors="ignore").splitlines()
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    return _merge_ranges_sorted(sorted(ranges))
+
+
+def _index_lines(path: Path) -> tuple[bytes, list[int]]:
+    """Return the file bytes and the byte offset where each line starts.
 
+    The offsets end with a sentinel one past the last line's newline, so line
+    ``n`` spans ``data[offsets[n - 1] : offsets[n] - 1]``. Line numbering
+    matches ``str.splitlines()``.
+    """
+    data = path.read_bytes()
+    if _OTHER_LINE_BREAKS_RE.search(data):
+        # Rare: normalise \r\n, \r, \f etc. so "\n" offsets match splitlines().
+        lines = data.decode("utf-8", errors="ignore").splitlines()
+        data = "".join(f"{line}\n" for line in lines).encode("utf-8")
+    offsets = [0, *itertools.accumulate(len(part) + 1 for part in data.split(b"\n"))]
+    if not data[offsets[-2] :].decode("utf-8", errors="ignore"):
+        offsets.pop()  # nothing (decodable) after the final newline
+    return data, offsets
 
-def _extract_snippet(lines: list[str], start: int, end: int) -> str:
+
+def _extract_snippet(data: bytes, offsets: list[int], start: int, end: int) -> str:
     start = max(1, start)
-    end = min(len(lines), end)
+    end = min(len(offsets) - 1, end)
     if start > end:
         return ""
-    return "\n".join(lines[start - 1 : end])
+    return data[offsets[start - 1] : offsets[end] - 1].decode("utf-8", errors="ignore")
 
 
 def _ast_available() -> bool:
@@ -212,32 +313,47 @@ def _ast_available() -> bool:
         return False
 
 
-def _ast_block_for_line(path: Path, line: int) -> Optional[tuple[int, int]]:
-    if not _ast_available():
-        return None
-    parser = _AST_PARSER
-    if parser is None:
-        return None
-    source = path.read_bytes()
-    tree = parser.parse(source)
-    target_row = line - 1
-
-    def visit(node) -> Optional[tuple[int, int]]:
-        if node.type in {"function_definition", "class_definition"}:
-            start_row = node.start_point[0]
-            end_row = node.end_point[0]
-            if start_row <= target_row <= end_row:
-                return (start_row + 1, end_row + 1)
-        for child in node.children:
-            result = visit(child)
-            if result:
-                return result
-        return None
-
-    return visit(tree.root_node)
+_AST_BLOCK_TYPES = frozenset({"function_definition", "class_definition"})
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_tree(path_str: str, mtime_ns: int):
+    # Every signal line and hunk anchor in a file looks up the same tree;
+    # build_context_bundle clears the cache once its files are done.
+    return _AST_PARSER.parse(Path(path_str).read_bytes())
+
+
+def _ast_blocks_for_lines(path: Path, lines: set[int]) -> dict[int, tuple[int, int]]:
+    # Innermost enclosing function/class block for each line, from one cursor
+    # walk that only descends into nodes whose rows hold a requested line.
+    # Blocks are seen outermost first, so inner ones overwrite.
+    if not lines or not _ast_available() or _AST_PARSER is None:
+        return {}
+    tree = _parse_tree(str(path), path.stat().st_mtime_ns)
+    rows = sorted(line - 1 for line in lines)
+    blocks: dict[int, tuple[int, int]] = {}
+    cursor = tree.walk()
+    while True:
+        node = cursor.node
+        start_row = node.start_point[0]
+        end_row = node.end_point[0]
+        lo = bisect.bisect_left(rows, start_row)
+        hi = bisect.bisect_right(rows, end_row)
+        if lo < hi:
+            if node.type in _AST_BLOCK_TYPES:
+                block = (start_row + 1, end_row + 1)
+                for row in rows[lo:hi]:
+                    blocks[row + 1] = block
+            if cursor.goto_first_child():
+                continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return blocks
 
 
 def _truncate_text(text: str, max_bytes: int) -> str:
+    if len(text) <= max_bytes and text.isascii():
+        return text  # fits without encoding
     encoded = text.encode("utf-8")
     if len(encoded) <= max_bytes:
         return text
@@ -250,8 +366,16 @@ def _truncate_text(text: str, max_bytes: int) -> str:
     keep = max_bytes - marker_bytes
     head = keep // 2
     tail = keep - head
-    head_text = encoded[:head].decode("utf-8", errors="ignore")
-    tail_text = encoded[-tail:].decode("utf-8", errors="ignore")
+    head_bytes = encoded[:head]
+    tail_bytes = encoded[-tail:]
+    # Cut at line boundaries where possible so no line (or code point) is
+    # split; a single long line still falls back to a byte cut.
+    if b"\n" in head_bytes:
+        head_bytes = head_bytes.rpartition(b"\n")[0]
+    if b"\n" in tail_bytes:
+        tail_bytes = tail_bytes.partition(b"\n")[2]
+    head_text = head_bytes.decode("utf-8", errors="ignore")
+    tail_text = tail_bytes.decode("utf-8", errors="ignore")
     return f"{head_text}{marker}{tail_text}"
 
 
@@ -267,68 +391,79 @@ def _collect_text_fields(bundle: dict[str, Any]) -> list[tuple[dict[str, Any], s
     return refs
 
 
+def _bundle_serialized_size(payload: dict[str, Any]) -> int:
+    return len(_stable_json_bytes(payload))
+
+
+def _drop_optional(payload: dict[str, Any]) -> None:
+    for field in ("selection_order", "excluded_by_rule"):
+        if field in payload:
+            payload[field] = []
+
+
+def _strip_file_payload(payload: dict[str, Any]) -> None:
+    for entry in payload.get("files", []):
+        entry["snippets"] = []
+        entry["diff_hunks"] = []
+
+
+def _strip_metadata(payload: dict[str, Any]) -> None:
+    for field in ("selection_order", "excluded_by_rule", "gate_report_path", "mutation_diff_path"):
+        payload.pop(field, None)
+    payload["metadata_trimmed"] = True
+
+
 def _apply_truncation(bundle: dict[str, Any], max_bytes: int) -> tuple[int, bool]:
-    def serialized_size(payload: dict[str, Any]) -> int:
-        return len(_stable_json(payload).encode("utf-8"))
-
-    def drop_optional(payload: dict[str, Any]) -> None:
-        for field in ("selection_order", "excluded_by_rule"):
-            if field in payload:
-                payload[field] = []
-
-    def strip_file_payload(payload: dict[str, Any]) -> None:
-        for entry in payload.get("files", []):
-            entry["snippets"] = []
-            entry["diff_hunks"] = []
-
-    def strip_metadata(payload: dict[str, Any]) -> None:
-        for field in ("selection_order", "excluded_by_rule", "gate_report_path", "mutation_diff_path"):
-            payload.pop(field, None)
-        payload["metadata_trimmed"] = True
-    size = serialized_size(bundle)
+    size = _bundle_serialized_size(bundle)
     if size <= max_bytes:
         return size, False
 
     truncation_applied = True
 
-    while size > max_bytes and len(bundle.get("files", [])) > 1:
-        bundle["files"].pop()
-        size = serialized_size(bundle)
+    # Compact JSON is additive: dropping the last of n > 1 files removes its
+    # own serialization plus one comma, so pops need no re-serialization.
+    files = bundle.get("files", [])
+    while size > max_bytes and len(files) > 1:
+        size -= len(_stable_json_bytes(files.pop())) + 1
 
     refs = _collect_text_fields(bundle)
     if not refs:
         return size, truncation_applied
 
-    stripped = deepcopy(bundle)
-    drop_optional(stripped)
-    for ref in _collect_text_fields(stripped):
-        ref[0][ref[1]] = ""
-
-    base_size = serialized_size(stripped)
+    # Each text contributes its encoded string length (less the two quotes of
+    # an empty string), and each optional list its length less "[]", so the
+    # budget base (texts emptied, optional lists dropped) needs no copy.
+    empty_size = size - sum(len(_stable_json_bytes(original)) - 2 for _, _, original in refs)
+    base_size = empty_size
+    for field in ("selection_order", "excluded_by_rule"):
+        if field in bundle:
+            base_size -= len(_stable_json_bytes(bundle[field])) - 2
     if base_size >= max_bytes:
-        drop_optional(bundle)
+        _drop_optional(bundle)
         for ref in refs:
             ref[0][ref[1]] = ""
-        strip_file_payload(bundle)
-        size = serialized_size(bundle)
+        _strip_file_payload(bundle)
+        size = _bundle_serialized_size(bundle)
         if size > max_bytes:
-            strip_metadata(bundle)
-            size = serialized_size(bundle)
+            _strip_metadata(bundle)
+            size = _bundle_serialized_size(bundle)
         return size, truncation_applied
 
     remaining = max_bytes - base_size
     per_text = max(0, remaining // len(refs))
 
-    def apply_limit(limit: int) -> None:
+    def apply_limit(limit: int) -> int:
+        total = empty_size
         for target, key, original in refs:
-            target[key] = _truncate_text(original, limit)
+            text = _truncate_text(original, limit)
+            target[key] = text
+            total += len(_stable_json_bytes(text)) - 2
+        return total
 
-    apply_limit(per_text)
-    size = serialized_size(bundle)
+    size = apply_limit(per_text)
     while size > max_bytes and per_text > 0:
         per_text = int(per_text * 0.8)
-        apply_limit(per_text)
-        size = serialized_size(bundle)
+        size = apply_limit(per_text)
 
     return size, truncation_applied
 
@@ -351,26 +486,33 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
         diff_files, diff_parse_status, diff_parse_error = [], "skipped", None
     else:
         diff_files, diff_parse_status, diff_parse_error = _load_diff(mutation_diff_path)
-    ast_blocks_status = "ok" if _ast_available() else "unavailable"
+    ast_available = _ast_available()
+    ast_blocks_status = "ok" if ast_available else "unavailable"
+    ast_enabled = request.include_ast_blocks and ast_available
 
     file_info: dict[str, dict[str, Any]] = {}
     excluded_samples: dict[str, list[str]] = {}
 
+    # Signals tend to repeat the same few paths; resolve each raw path once.
+    resolve_cache: dict[str, Optional[Path]] = {}
+    exists_cache: dict[str, bool] = {}
     for sig in signals:
         path = sig["path"]
         line = sig["line"]
-        resolved = _resolve_path(repo_dir, path)
+        if path not in resolve_cache:
+            resolve_cache[path] = _resolve_path(repo_dir, path, exists_cache)
+        resolved = resolve_cache[path]
         if not resolved:
             continue
-        rel = resolved.relative_to(repo_dir)
+        rel = resolved.relative_to(repo_dir).as_posix()
         excluded_by = _matches_exclude(rel, EXCLUDE_PATTERNS)
         if excluded_by:
             samples = excluded_samples.setdefault(excluded_by, [])
             if len(samples) < EXCLUDE_CAP:
-                samples.append(rel.as_posix())
+                samples.append(rel)
             continue
         info = file_info.setdefault(
-            rel.as_posix(),
+            rel,
             {"reasons": set(), "signal_lines": set(), "hunks": [], "resolved": resolved},
         )
         info["reasons"].add("gate_signal")
@@ -378,11 +520,13 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
 
     for diff in diff_files:
         path = diff["path"]
-        resolved = _resolve_path(repo_dir, path)
+        if path not in resolve_cache:
+            resolve_cache[path] = _resolve_path(repo_dir, path, exists_cache)
+        resolved = resolve_cache[path]
         rel_path = None
         if resolved:
             rel_path = resolved.relative_to(repo_dir).as_posix()
-        excluded_by = _matches_exclude(Path(rel_path), EXCLUDE_PATTERNS)
+        excluded_by = _matches_exclude(rel_path, EXCLUDE_PATTERNS)
         if excluded_by:
             samples = excluded_samples.setdefault(excluded_by, [])
             if len(samples) < EXCLUDE_CAP:
@@ -390,7 +534,7 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
             continue
         else:
             rel_path = _strip_diff_prefix(path)
-            if _matches_exclude(Path(rel_path), EXCLUDE_PATTERNS):
+            if _matches_exclude(rel_path, EXCLUDE_PATTERNS):
                 continue
         info = file_info.setdefault(
             rel_path,
@@ -411,61 +555,64 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
     ordered_items = ordered_items[: request.max_files]
 
     files_payload: list[dict[str, Any]] = []
-    for rel_path, info in ordered_items:
-        resolved = info.get("resolved")
-        reasons = sorted(info["reasons"])
-        hunks = sorted(
-            info.get("hunks", []),
-            key=lambda h: (h.get("source_start", 0), h.get("target_start", 0)),
-        )
-        snippets: list[dict[str, Any]] = []
-        if resolved and resolved.exists():
-            lines = _read_lines(resolved)
-            ranges_by_kind: dict[str, list[tuple[int, int]]] = {
-                "gate_signal": [],
-                "mutation_hunk": [],
-                "ast_block": [],
-            }
-            for line in sorted(info.get("signal_lines", [])):
-                ranges_by_kind["gate_signal"].append(
-                    (line - request.context_radius_lines, line + request.context_radius_lines)
-                )
-                if request.include_ast_blocks and _ast_available():
-                    ast_range = _ast_block_for_line(resolved, line)
-                    if ast_range:
-                        ranges_by_kind["ast_block"].append(ast_range)
-            for hunk in hunks:
-                anchor = hunk.get("target_start") or hunk.get("source_start") or 1
-                ranges_by_kind["mutation_hunk"].append(
-                    (anchor - request.context_radius_lines, anchor + request.context_radius_lines)
-                )
-                if request.include_ast_blocks and _ast_available():
-                    ast_range = _ast_block_for_line(resolved, anchor)
-                    if ast_range:
-                        ranges_by_kind["ast_block"].append(ast_range)
-
-            for kind, ranges in ranges_by_kind.items():
-                merged = _merge_ranges([(max(1, s), max(1, e)) for s, e in ranges])
-                for start, end in merged:
-                    text = _extract_snippet(lines, start, end)
-                    snippets.append(
-                        {
-                            "kind": kind,
-                            "start_line": start,
-                            "end_line": end,
-                            "text": text,
-                        }
-                    )
-
-        snippets = sorted(snippets, key=lambda s: (s["start_line"], s["end_line"], s["kind"]))
-        files_payload.append(
-            {
-                "path": rel_path,
-                "reasons": reasons,
-                "snippets": snippets,
-                "diff_hunks": hunks,
-            }
-        )
+    # Parsed trees are only reused within one build; drop them even when a
+    # file fails mid-way so stale trees don't outlive the call.
+    try:
+        for rel_path, info in ordered_items:
+            resolved = info.get("resolved")
+            reasons = sorted(info["reasons"])
+            hunks = sorted(
+                info.get("hunks", []),
+                key=lambda h: (h.get("source_start", 0), h.get("target_start", 0)),
+            )
+            snippets: list[dict[str, Any]] = []
+            if resolved and resolved.exists():
+                data, offsets = _index_lines(resolved)
+                signal_lines = sorted(info.get("signal_lines", []))
+                anchors = [
+                    hunk.get("target_start") or hunk.get("source_start") or 1 for hunk in hunks
+                ]
+                ast_blocks: dict[int, tuple[int, int]] = {}
+                if ast_enabled:
+                    ast_blocks = _ast_blocks_for_lines(resolved, {*signal_lines, *anchors})
+                radius = request.context_radius_lines
+                signal_ranges = [
+                    (max(1, line - radius), max(1, line + radius)) for line in signal_lines
+                ]
+                hunk_ranges = [
+                    (max(1, anchor - radius), max(1, anchor + radius)) for anchor in anchors
+                ]
+                ast_ranges = [
+                    ast_blocks[line] for line in (*signal_lines, *anchors) if line in ast_blocks
+                ]
+
+                # Signal windows come from sorted lines with a fixed radius, so
+                # only hunk anchors and AST blocks need sorting. Entries are
+                # (start, end, kind code) so the sort compares ints only.
+                spans = [(s, e, _KIND_GATE_SIGNAL) for s, e in _merge_ranges_sorted(signal_ranges)]
+                spans += [(s, e, _KIND_MUTATION_HUNK) for s, e in _merge_ranges(hunk_ranges)]
+                spans += [(s, e, _KIND_AST_BLOCK) for s, e in _merge_ranges(ast_ranges)]
+                spans.sort()
+                snippets = [
+                    {
+                        "kind": _SNIPPET_KINDS[kind],
+                        "start_line": start,
+                        "end_line": end,
+                        "text": _extract_snippet(data, offsets, start, end),
+                    }
+                    for start, end, kind in spans
+                ]
+
+            files_payload.append(
+                {
+                    "path": rel_path,
+                    "reasons": reasons,
+                    "snippets": snippets,
+                    "diff_hunks": hunks,
+                }
+            )
+    finally:
+        _parse_tree.cache_clear()
 
     selection_order: list[dict[str, Any]] = []
     for entry in files_payload:
@@ -506,8 +653,10 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
 
     total_bytes, truncation_applied = _apply_truncation(bundle, request.max_bytes)
 
-    bundle_for_hash = deepcopy(bundle)
-    context_id = hashlib.sha256(_stable_json(bundle_for_hash).encode("utf-8")).hexdigest()
+    # Stays SHA-256: with SHA-NI it outpaces blake2b, and ids already on disk
+    # (and in teacher-patch-propose runs) keep their meaning.
+    payload = _stable_json_bytes(bundle)
+    context_id = hashlib.sha256(payload).hexdigest()
     bundle["context_id"] = context_id
 
     context_dir = repo_dir / ".pf_manifest" / "context"
@@ -515,7 +664,10 @@ def build_context_bundle(request: ContextPackRequest) -> ContextPackResponse:
     _atomic_write_json(context_bundle_path, bundle)
 
     bundle["truncation_applied"] = truncation_applied
-    total_bytes = len(_stable_json(bundle).encode("utf-8"))
+    # The hashed payload re-serialized with the real id (same width as the
+    # zero placeholder) and the flag set: "true" is one byte shorter than
+    # "false".
+    total_bytes = len(payload) - int(truncation_applied)
 
     return ContextPackResponse(
         context_bundle_path=str(context_bundle_path),
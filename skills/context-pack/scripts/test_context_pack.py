@@ -1,7 +1,12 @@
 import json
 from pathlib import Path
 
-from context_pack import ContextPackRequest, build_context_bundle
+from context_pack import (
+    ContextPackRequest,
+    _stable_json_bytes,
+    _truncate_text,
+    build_context_bundle,
+)
 
 
 def _write_file(path: Path, lines: int) -> None:
@@ -115,3 +120,42 @@ def test_context_pack_without_diff(tmp_path: Path) -> None:
     assert response.included_files == ["src/foo.py"]
     bundle = json.loads(Path(response.context_bundle_path).read_text(encoding="utf-8"))
     assert bundle.get("diff_parse_status") == "skipped"
+
+
+def test_truncate_text_cuts_on_line_boundaries() -> None:
+    text = "\n".join(f"line {i}" for i in range(1, 41))
+    truncated = _truncate_text(text, 80)
+    assert len(truncated.encode("utf-8")) <= 80
+    head, marker, tail = truncated.partition("\n...<truncated>...\n")
+    assert marker
+    lines = set(text.splitlines())
+    assert all(line in lines for line in head.splitlines() + tail.splitlines())
+
+
+def test_stable_json_escapes_del_like_json() -> None:
+    payload = {"snippet": "a\x7fb", "path": "src/foo.py"}
+    expected = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    assert _stable_json_bytes(payload) == expected
+
+
+def test_context_pack_snippet_with_del_character(tmp_path: Path) -> None:
+    repo_dir = tmp_path / "repo"
+    file_path = repo_dir / "src" / "foo.py"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text("\n".join(f"line {i}\x7f" for i in range(1, 21)), encoding="utf-8")
+
+    gate_report = repo_dir / "gate_report.json"
+    _write_gate_report(gate_report, "src/foo.py", 5)
+
+    request = ContextPackRequest(
+        repo_dir=str(repo_dir),
+        gate_report_path=str(gate_report),
+        mutation_diff_path=None,
+        max_bytes=10000,
+        max_files=5,
+        context_radius_lines=5,
+    )
+    response = build_context_bundle(request)
+    raw = Path(response.context_bundle_path).read_bytes()
+    assert b"\x7f" not in raw
+    assert b"\\u007f" in raw
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import hashlib
 import json
 import os
@@ -9,9 +10,10 @@ import subprocess
 import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, TypeVar
 
 try:
     from pydantic import BaseModel, Field, ConfigDict
@@ -26,6 +28,8 @@ except Exception:  # pragma: no cover - docker not installed
     docker = None
     DockerException = ImageNotFound = Exception
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
 
 DEFAULT_MAX_LOG_BYTES = 200_000
 DEFAULT_REPEATS = 1
@@ -45,7 +49,30 @@ NOISE_DIRS = {
     ".tmp-test",
 }
 NOISE_SUFFIXES = {".pyc"}
+# Per-file digest in tree snapshots. Changing it changes every tree_hash_*,
+# so reports from before and after would no longer compare equal.
+SNAPSHOT_HASH_ALGORITHM = "sha256"
+# Smaller trees are hashed inline; a thread pool costs more than it saves.
+SNAPSHOT_PARALLEL_MIN_FILES = 16
 TRUNCATION_MARKER = b"\n...<truncated>...\n"
+IMPORT_PROBE_MARKER = b"IMPORT_PROBE_JSON="
+# Upper bound on gate containers run at once; older docker daemons struggle past ten.
+MAX_CONCURRENT_GATES = 10
+
+# One pass over the command; the group name says which rule tripped.
+_UNSAFE_RE = re.compile(
+    r"(?P<sudo>\bsudo\b)"
+    r"|(?P<rm_rf_root>rm\s+-rf\s+/)"
+    r"|(?P<mkfs>\bmkfs\b)"
+    r"|(?P<dd>\bdd\s+if=)"
+    r"|(?P<fork_bomb>:\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;:)"
+)
+_PYTEST_PATTERNS = (
+    re.compile(r"^\s*File \"(.+?)\", line (\d+)", re.MULTILINE),
+    re.compile(r"^(.+?\.py):(\d+):\s*(.+)$", re.MULTILINE),
+)
+_RUFF_PATTERN = re.compile(r"^(.+?):(\d+):(\d+):\s*([A-Z]\d+)\s+(.*)$", re.MULTILINE)
+_MYPY_PATTERN = re.compile(r"^(.+?):(\d+):(?:\d+:)?\s*(error|note|warning):\s*(.*)$", re.MULTILINE)
 
 
 class GatesRunRequest(BaseModel):
@@ -205,6 +232,22 @@ def _model_dump(model: BaseModel) -> dict[str, Any]:
     return model.dict()
 
 
+def _model_json(model: BaseModel) -> str:
+    # pydantic v2 serializes straight from its core, skipping the
+    # intermediate dict that json.dumps would walk a second time.
+    if hasattr(model, "model_dump_json"):
+        return model.model_dump_json(indent=2)
+    return json.dumps(_model_dump(model), indent=2)
+
+
+def _construct(model_cls: type[ModelT], **fields: Any) -> ModelT:
+    # For models assembled from values this module already produced: skip
+    # validation (pydantic v1 spells it construct()).
+    if hasattr(model_cls, "model_construct"):
+        return model_cls.model_construct(**fields)
+    return model_cls.construct(**fields)
+
+
 def _read_json(path: Path) -> dict[str, Any]:
     return json.loads(path.read_text(encoding="utf-8"))
 
@@ -249,6 +292,23 @@ def _truncate_log(data: bytes, max_bytes: int) -> tuple[str, bool]:
     return truncated.decode("utf-8", errors="ignore"), True
 
 
+def _find_import_probe(data: bytes) -> Optional[str]:
+    # Last IMPORT_PROBE_JSON= line wins. Only the newline-delimited segments
+    # that contain the marker are decoded, never the whole log.
+    pos = data.rfind(IMPORT_PROBE_MARKER)
+    while pos != -1:
+        start = data.rfind(b"\n", 0, pos) + 1
+        end = data.find(b"\n", pos)
+        if end == -1:
+            end = len(data)
+        segment = data[start:end].decode("utf-8", errors="ignore")
+        for line in reversed(segment.splitlines()):
+            if line.startswith("IMPORT_PROBE_JSON="):
+                return line.split("=", 1)[1].strip()
+        pos = data.rfind(IMPORT_PROBE_MARKER, 0, start)
+    return None
+
+
 def _hash_cmds(cmds: list[str]) -> str:
     payload = json.dumps(cmds, separators=(",", ":"))
     return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -359,18 +419,40 @@ def _iter_repo_files(repo_dir: Path, use_git: bool) -> list[Path]:
     return files
 
 
+def _file_digest(path: Path) -> tuple[str, int]:
+    # Streams the file through hashlib instead of holding it as one bytes
+    # object; file_digest (3.11+) loops in C and releases the GIL.
+    with open(path, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        if hasattr(hashlib, "file_digest"):
+            digest = hashlib.file_digest(handle, SNAPSHOT_HASH_ALGORITHM)
+        else:  # pragma: no cover - Python < 3.11
+            digest = hashlib.new(SNAPSHOT_HASH_ALGORITHM)
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest(), size
+
+
+def _snapshot_entry(repo_dir: Path, path: Path) -> Optional[tuple[str, dict[str, Any]]]:
+    try:
+        rel = str(path.relative_to(repo_dir))
+        digest, size = _file_digest(path)
+    except Exception:
+        return None
+    return rel, {"hash": digest, "size": size}
+
+
 def _tree_snapshot(repo_dir: Path, use_git: bool) -> dict[str, dict[str, Any]]:
-    snapshot: dict[str, dict[str, Any]] = {}
     files = _iter_repo_files(repo_dir, use_git)
-    for path in files:
-        try:
-            rel = str(path.relative_to(repo_dir))
-            data = path.read_bytes()
-            digest = hashlib.sha256(data).hexdigest()
-            snapshot[rel] = {"hash": digest, "size": len(data)}
-        except Exception:
-            continue
-    return snapshot
+    if len(files) < SNAPSHOT_PARALLEL_MIN_FILES:
+        entries = [_snapshot_entry(repo_dir, path) for path in files]
+    else:
+        # Reads block and hashing drops the GIL, so threads overlap both.
+        # map() keeps file order, so the snapshot is built the same way.
+        workers = min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = list(executor.map(functools.partial(_snapshot_entry, repo_dir), files))
+    return dict(entry for entry in entries if entry is not None)
 
 
 def _tree_hash(snapshot: dict[str, dict[str, Any]]) -> str:
@@ -408,18 +490,21 @@ def _diff_summary(
     }
 
 
+def _empty_diff_summary() -> dict[str, Any]:
+    return {
+        "supported": True,
+        "added": 0,
+        "removed": 0,
+        "modified": 0,
+        "paths": [],
+        "paths_truncated": False,
+        "bytes_changed": 0,
+    }
+
+
 def _unsafe_cmd(cmd: str) -> Optional[str]:
-    patterns = [
-        r"\bsudo\b",
-        r"rm\s+-rf\s+/",
-        r"\bmkfs\b",
-        r"\bdd\s+if=",
-        r":\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;:",
-    ]
-    for pattern in patterns:
-        if re.search(pattern, cmd):
-            return pattern
-    return None
+    match = _UNSAFE_RE.search(cmd)
+    return match.lastgroup if match else None
 
 
 def _docker_available() -> bool:
@@ -489,13 +574,12 @@ def _gate_commands(profile: dict[str, Any], gates: list[str]) -> list[GateComman
     return commands
 
 
-def _parse_pytest(log_text: str) -> list[GateSignal]:
-    signals: list[GateSignal] = []
-    patterns = [
-        re.compile(r"^\s*File \"(.+?)\", line (\d+)", re.MULTILINE),
-        re.compile(r"^(.+?\.py):(\d+):\s*(.+)$", re.MULTILINE),
-    ]
-    for pattern in patterns:
+SignalKey = tuple[str, str, int, str]
+
+
+def _parse_pytest(log_text: str) -> list[SignalKey]:
+    signals: list[SignalKey] = []
+    for pattern in _PYTEST_PATTERNS:
         for match in pattern.finditer(log_text):
             path = _normalize_path(match.group(1))
             line = int(match.group(2))
@@ -503,39 +587,35 @@ def _parse_pytest(log_text: str) -> list[GateSignal]:
                 message = match.group(3)
             else:
                 message = "pytest"
-            signals.append(GateSignal(tool="pytest", path=path, line=line, message=message.strip()))
+            signals.append(("pytest", path, line, message.strip()))
     return signals
 
 
-def _parse_ruff(log_text: str) -> list[GateSignal]:
-    signals: list[GateSignal] = []
-    pattern = re.compile(r"^(.+?):(\d+):(\d+):\s*([A-Z]\d+)\s+(.*)$", re.MULTILINE)
-    for match in pattern.finditer(log_text):
+def _parse_ruff(log_text: str) -> list[SignalKey]:
+    signals: list[SignalKey] = []
+    for match in _RUFF_PATTERN.finditer(log_text):
         path = _normalize_path(match.group(1))
         line = int(match.group(2))
         code = match.group(4)
         message = match.group(5)
-        signals.append(
-            GateSignal(tool="ruff", path=path, line=line, message=f"{code} {message}".strip())
-        )
+        signals.append(("ruff", path, line, f"{code} {message}".strip()))
     return signals
 
 
-def _parse_mypy(log_text: str) -> list[GateSignal]:
-    signals: list[GateSignal] = []
-    pattern = re.compile(r"^(.+?):(\d+):(?:\d+:)?\s*(error|note|warning):\s*(.*)$", re.MULTILINE)
-    for match in pattern.finditer(log_text):
+def _parse_mypy(log_text: str) -> list[SignalKey]:
+    signals: list[SignalKey] = []
+    for match in _MYPY_PATTERN.finditer(log_text):
         path = _normalize_path(match.group(1))
         line = int(match.group(2))
         message = f"{match.group(3)}: {match.group(4)}"
-        signals.append(GateSignal(tool="mypy", path=path, line=line, message=message.strip()))
+        signals.append(("mypy", path, line, message.strip()))
     return signals
 
 
 def _extract_signals(gate: str, cmd: Optional[str], log_text: str) -> list[GateSignal]:
     if not cmd:
         return []
-    signals: list[GateSignal] = []
+    signals: list[SignalKey] = []
     if gate == "test" or "pytest" in cmd:
         signals.extend(_parse_pytest(log_text))
     if gate == "lint" or "ruff" in cmd:
@@ -543,15 +623,12 @@ def _extract_signals(gate: str, cmd: Optional[str], log_text: str) -> list[GateS
     if gate == "typecheck" or "mypy" in cmd:
         signals.extend(_parse_mypy(log_text))
 
-    seen = set()
-    deduped: list[GateSignal] = []
-    for signal in signals:
-        key = (signal.tool, signal.path, signal.line, signal.message)
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append(signal)
-    return deduped
+    # dict.fromkeys dedupes while keeping first-seen order; models are only
+    # built for the survivors.
+    return [
+        _construct(GateSignal, tool=tool, path=path, line=line, message=message)
+        for tool, path, line, message in dict.fromkeys(signals)
+    ]
 
 
 def _run_container_gate(
@@ -564,7 +641,8 @@ def _run_container_gate(
     log_path: Path,
 ) -> GateResult:
     if not gate_cmd.cmd:
-        return GateResult(
+        return _construct(
+            GateResult,
             gate=gate_cmd.gate,
             cmd=None,
             status="skipped",
@@ -622,22 +700,23 @@ def _run_container_gate(
                 status = "timeout"
 
         log_bytes = container.logs(stdout=True, stderr=True)
-        lower = log_bytes.decode("utf-8", errors="ignore").lower()
-        if "contextualversionconflict" in lower or "resolutionimpossible" in lower:
+        lower = log_bytes.lower()
+        if b"contextualversionconflict" in lower or b"resolutionimpossible" in lower:
             log_flags.append("dependency_conflict")
-        if "no matching distribution found" in lower or "could not find a version that satisfies the requirement" in lower:
+        if (
+            b"no matching distribution found" in lower
+            or b"could not find a version that satisfies the requirement" in lower
+        ):
             log_flags.append("invalid_requirement")
-        if "pywin32" in lower and "no matching distribution found" in lower:
+        if b"pywin32" in lower and b"no matching distribution found" in lower:
             log_flags.append("platform_incompatible_dependency")
         if gate_cmd.pre_cmds:
-            text = log_bytes.decode("utf-8", errors="ignore")
-            for line in text.splitlines():
-                if line.startswith("IMPORT_PROBE_JSON="):
-                    payload = line.split("=", 1)[1].strip()
-                    try:
-                        import_probe = json.loads(payload)
-                    except Exception:
-                        import_probe = {"error": "invalid_json"}
+            payload = _find_import_probe(log_bytes)
+            if payload is not None:
+                try:
+                    import_probe = json.loads(payload)
+                except Exception:
+                    import_probe = {"error": "invalid_json"}
     except (DockerException, Exception):
         status = "error"
     finally:
@@ -653,7 +732,8 @@ def _run_container_gate(
     log_excerpt, truncated = _truncate_log(log_bytes, max_log_bytes)
     signals = _extract_signals(gate_cmd.gate, gate_cmd.cmd, log_excerpt)
 
-    return GateResult(
+    return _construct(
+        GateResult,
         gate=gate_cmd.gate,
         cmd=gate_cmd.cmd,
         status=status,
@@ -686,9 +766,8 @@ def _run_repo_setup(
     use_git = (repo_dir / ".git").exists()
     snapshot_before = _tree_snapshot(repo_dir, use_git)
     tree_hash_before = _tree_hash(snapshot_before)
-    diff_before = _git_summary(repo_dir) if use_git else None
-    if not use_git:
-        diff_before = _diff_summary(snapshot_before, snapshot_before)
+    # A snapshot diffed against itself is always empty; no need to walk it.
+    diff_before = _git_summary(repo_dir) if use_git else _empty_diff_summary()
     if not cmds:
         return RepoSetupReport(
             cmds=[],
@@ -833,8 +912,6 @@ def _run_repo_setup(
     idempotent: Optional[bool] = None
     tree_hash_after_idempotency = tree_hash_after
     if status == "pass" and idempotency_check != "off":
-        snapshot_before_idem = snapshot_after
-        diff_after_idem = diff_after
         for index, cmd in enumerate(cmds):
             container = None
             try:
@@ -870,9 +947,9 @@ def _run_repo_setup(
         untracked_before = (
             diff_after.get("untracked_paths", []) if use_git and diff_after else []
         )
-        diff_after_idem = (
-            _git_summary(repo_dir) if use_git else _diff_summary(snapshot_before_idem, snapshot_after_idem)
-        )
+        # Only the git summary's untracked paths feed the verdict below; the
+        # snapshot path is covered by comparing tree hashes.
+        diff_after_idem = _git_summary(repo_dir) if use_git else None
         untracked_after = (
             diff_after_idem.get("untracked_paths", []) if use_git and diff_after_idem else []
         )
@@ -949,7 +1026,8 @@ def _summarize(results: list[GateResult]) -> GateSummary:
     for result in results:
         counts[result.status] = counts.get(result.status, 0) + 1
     total = sum(counts.values())
-    return GateSummary(
+    return _construct(
+        GateSummary,
         pass_count=counts.get("pass", 0),
         fail_count=counts.get("fail", 0),
         error_count=counts.get("error", 0),
@@ -1472,7 +1550,8 @@ def run_gates(request: GatesRunRequest) -> GatesRunResponse:
         results: list[GateResult] = []
         for gate_cmd in gate_commands:
             results.append(
-                GateResult(
+                _construct(
+                    GateResult,
                     gate=gate_cmd.gate,
                     cmd=gate_cmd.cmd,
                     status="error",
@@ -1484,24 +1563,36 @@ def run_gates(request: GatesRunRequest) -> GatesRunResponse:
                     log_excerpt="repo_setup failed; see setup log for details",
                 )
             )
-        runs.append(GateRun(run_index=0, results=results))
+        runs.append(_construct(GateRun, run_index=0, results=results))
     else:
-        for run_index in range(repeats):
-            results: list[GateResult] = []
-            for gate_cmd in gate_commands:
-                log_path = gates_dir / f"{run_id}.run{run_index}.{gate_cmd.gate}.log"
-                result = _run_container_gate(
-                    client,
-                    request.image_tag,
-                    repo_dir,
-                    gate_cmd,
-                    env,
-                    max_log_bytes,
-                    log_path,
-                )
-                results.append(result)
-            runs.append(GateRun(run_index=run_index, results=results))
-            signatures.append(_signature(results))
+        workers = max(1, min(MAX_CONCURRENT_GATES, len(gate_commands)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for run_index in range(repeats):
+                # Gates of one run are separate containers and overlap, except
+                # that a gate with pre_cmds (pip install -e ., import probe)
+                # writes into the shared /workspace mount: it waits for the
+                # gates before it and runs alone, as it would serially.
+                # Results keep submission order. Repeats stay sequential.
+                futures = []
+                for gate_cmd in gate_commands:
+                    if gate_cmd.pre_cmds:
+                        wait(futures)
+                    future = executor.submit(
+                        _run_container_gate,
+                        client,
+                        request.image_tag,
+                        repo_dir,
+                        gate_cmd,
+                        env,
+                        max_log_bytes,
+                        gates_dir / f"{run_id}.run{run_index}.{gate_cmd.gate}.log",
+                    )
+                    if gate_cmd.pre_cmds:
+                        wait([future])
+                    futures.append(future)
+                results: list[GateResult] = [future.result() for future in futures]
+                runs.append(_construct(GateRun, run_index=run_index, results=results))
+                signatures.append(_signature(results))
 
     is_flaky = len(set(signatures)) > 1
     summary = _summarize(runs[-1].results) if runs else _summarize([])
@@ -1536,7 +1627,7 @@ def run_gates(request: GatesRunRequest) -> GatesRunResponse:
     )
 
     report_path = gates_dir / f"{run_id}.json"
-    _atomic_write_text(report_path, json.dumps(_model_dump(report), indent=2))
+    _atomic_write_text(report_path, _model_json(report))
     _update_unsupported_registry(repo_dir, triage, profile, report_path)
 
     return GatesRunResponse(